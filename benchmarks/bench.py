@@ -0,0 +1,327 @@
+"""
+Benchmarks the library scan, content filter, thumbnail and apply paths on a
+generated workshop tree. Runs headless: no display, GPU or engine binary is
+needed, the thumbnail phase is skipped when GdkPixbuf can't be imported.
+
+    python benchmarks/bench.py --items 3000 --output results.json
+    python benchmarks/bench.py --items 3000 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TYPES = ("scene", "video", "web", "Scene", "Video")
+RATINGS = ("Everyone", "Everyone", "Everyone", "Questionable", "Mature")
+TAGS = ("Anime", "Landscape", "Nature", "Sci-Fi", "Abstract", "Game", "Music", "Relaxing", "Cyberpunk", "Space")
+
+# How the generated items name and place their preview
+PREVIEW_LAYOUTS = (
+    ("preview.jpg", "preview.jpg"),
+    ("preview.jpg", "preview.jpg"),
+    ("preview.png", "preview.png"),
+    ("preview.gif", "preview.gif"),
+    # project.json names a file that only exists further down
+    ("preview.jpg", os.path.join("materials", "preview.jpg")),
+    # preview missing entirely
+    ("preview.jpg", None),
+)
+
+def png_bytes(width, height, seed):
+    """A gradient PNG with some noise, written with zlib only."""
+    rng = random.Random(seed)
+    rows = []
+    for y in range(height):
+        row = bytearray([0])
+        for x in range(width):
+            row += bytes(((x * 255 // width + rng.randrange(32)) & 255, (y * 255 // height) & 255, (seed * 37) & 255))
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+def gif_bytes(width, height, frames, seed):
+    """
+    An animated GIF. The LZW stream emits a clear code before the code table
+    grows, so every code stays 9 bits wide and no real compression is needed.
+    """
+    rng = random.Random(seed)
+    palette = b"".join(bytes((i, (i * 3) & 255, 255 - i)) for i in range(256))
+    out = bytearray(b"GIF89a" + struct.pack("<HHBBB", width, height, 0xF7, 0, 0) + palette)
+    out += b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00"
+
+    for frame in range(frames):
+        out += b"\x21\xf9\x04\x04\x05\x00\x00\x00"
+        out += b"\x2c" + struct.pack("<HHHHB", 0, 0, width, height, 0) + b"\x08"
+
+        codes = [256]
+        offset = rng.randrange(256)
+        for i in range(width * height):
+            if len(codes) % 250 == 0:
+                codes.append(256)
+            codes.append((i // width + offset + frame * 8) & 255)
+        codes.append(257)
+
+        bits, nbits, data = 0, 0, bytearray()
+        for code in codes:
+            bits |= code << nbits
+            nbits += 9
+            while nbits >= 8:
+                data.append(bits & 255)
+                bits >>= 8
+                nbits -= 8
+        if nbits:
+            data.append(bits & 255)
+        for i in range(0, len(data), 255):
+            block = data[i:i + 255]
+            out += bytes((len(block),)) + block
+        out += b"\x00"
+
+    out += b"\x3b"
+    return bytes(out)
+
+def jpeg_bytes(width, height, seed):
+    """A real JPEG when GdkPixbuf is around, PNG data otherwise (decoders sniff the content)."""
+    data = png_bytes(width, height, seed)
+    try:
+        import gi
+        gi.require_version('GdkPixbuf', '2.0')
+        from gi.repository import GdkPixbuf
+        loader = GdkPixbuf.PixbufLoader()
+        loader.write(data)
+        loader.close()
+        ok, jpeg = loader.get_pixbuf().save_to_bufferv("jpeg", ["quality"], ["85"])
+        if ok:
+            return bytes(jpeg)
+    except Exception:
+        pass
+    return data
+
+def generate_workshop(root, items, image_size=512, gif_frames=10, seed=1):
+    """Writes a fake workshop tree with items wallpapers under root."""
+    rng = random.Random(seed)
+    images = {
+        ".jpg": [jpeg_bytes(image_size, image_size, i) for i in range(4)],
+        ".png": [png_bytes(image_size, image_size, i) for i in range(4)],
+        ".gif": [gif_bytes(image_size // 2, image_size // 2, gif_frames, i) for i in range(2)],
+    }
+
+    os.makedirs(root, exist_ok=True)
+    for n in range(items):
+        wallpaper_id = str(1000000000 + n * 7919)
+        item_dir = os.path.join(root, wallpaper_id)
+        preview_name, preview_file = rng.choice(PREVIEW_LAYOUTS)
+
+        # Asset folders a recursive walk would have to descend into
+        for asset_dir in ("shaders", "models", "materials"):
+            os.makedirs(os.path.join(item_dir, asset_dir), exist_ok=True)
+        for i in range(rng.randrange(1, 6)):
+            with open(os.path.join(item_dir, "shaders", f"effect{i}.frag"), "w") as f:
+                f.write("void main() {}\n")
+
+        if preview_file:
+            with open(os.path.join(item_dir, preview_file), "wb") as f:
+                f.write(rng.choice(images[os.path.splitext(preview_file)[1]]))
+
+        project = {
+            "title": f"Wallpaper {n} {rng.choice(TAGS)}",
+            "description": " ".join(rng.choice(TAGS).lower() for _ in range(12)),
+            "type": rng.choice(TYPES),
+            "contentrating": rng.choice(RATINGS),
+            "tags": rng.sample(TAGS, rng.randrange(1, 4)),
+            "preview": preview_name,
+            "file": "scene.json",
+        }
+        with open(os.path.join(item_dir, "project.json"), "w", encoding="utf-8") as f:
+            json.dump(project, f)
+
+def timed(fn, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return {"best": min(runs), "median": statistics.median(runs), "runs": runs}, result
+
+def run_benchmarks(workshop_dir, cache_dir, repeat, thumbnails, screens):
+    # Point the config and every cache at the scratch dir before the modules read
+    # their paths, importing config creates its directory
+    os.environ["HOME"] = cache_dir
+    os.environ["XDG_CONFIG_HOME"] = os.path.join(cache_dir, ".config")
+    os.environ["XDG_CACHE_HOME"] = cache_dir
+    os.environ["XDG_RUNTIME_DIR"] = cache_dir
+    sys.path.insert(0, REPO_DIR)
+    from engine import build_args, plan_apply, screen_specs
+    from library import WALLPAPER_TYPES, LibraryIndex, matches_filter
+    from search import SORT_ORDERS, SearchIndex, sort_key
+    from tracing import tracer
+
+    tracer.enable()
+    phases = {}
+    index_path = os.path.join(cache_dir, "bench-index.json")
+
+    def cold_scan():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        return LibraryIndex(index_path).rebuild(workshop_dir)
+
+    phases["scan_cold"], _ = timed(cold_scan, repeat)
+    index = LibraryIndex(index_path)
+    phases["scan_warm"], _ = timed(lambda: index.rescan(workshop_dir), repeat)
+
+    def first_item(scan):
+        for _ in scan:
+            return
+    phases["scan_first_item"], _ = timed(lambda: first_item(LibraryIndex(index_path).scan(workshop_dir)), repeat)
+
+    # Touch 1% of the project.json files, only those should be parsed again
+    entries = list(index.entries.values())
+    touched = entries[:max(1, len(entries) // 100)]
+    def incremental_scan():
+        for entry in touched:
+            os.utime(os.path.join(entry["dir"], "project.json"), ns=(time.time_ns(), time.time_ns()))
+        return index.rescan(workshop_dir)
+    phases["scan_incremental"], _ = timed(incremental_scan, repeat)
+
+    settings = [(mature, None) for mature in (False, True)] + [(False, (t,)) for t in WALLPAPER_TYPES]
+    def filter_all():
+        return [sum(1 for entry in entries if matches_filter(entry, mature, types)) for mature, types in settings]
+    phases["filter"], _ = timed(filter_all, repeat)
+
+    search_index = SearchIndex()
+    phases["search_index_build"], _ = timed(lambda: search_index.build(index.entries), repeat)
+
+    # Every prefix of the queries, like typing them one key at a time
+    queries = ["wallpaper landscape", "anime", "nature relaxing", "1000"]
+    keystrokes = [query[:n] for query in queries for n in range(1, len(query) + 1)]
+    def search_keystrokes():
+        for query in keystrokes:
+            search_index.search(query)
+        search_index.search("", "Anime")
+    phases[f"search_x{len(keystrokes) + 1}"], _ = timed(search_keystrokes, repeat)
+
+    def sort_all():
+        for order in SORT_ORDERS:
+            sorted(index.entries.items(), key=lambda item: sort_key(item[0], item[1], order))
+    phases["sort"], _ = timed(sort_all, repeat)
+
+    if thumbnails:
+        try:
+            from thumbnails import get_thumbnail
+        except Exception as e:
+            print(f"Skipping thumbnail phase: {e}")
+        else:
+            previews = [entry["preview_path"] for entry in entries if entry.get("preview_path")][:thumbnails]
+
+            def thumbnail_pass(sizes):
+                for img_path in previews:
+                    for size in sizes:
+                        get_thumbnail(img_path, size)
+
+            thumbnail_dir = os.path.join(cache_dir, "wallpaperengine-linux", "thumbnails")
+            def cold_thumbnails():
+                shutil.rmtree(thumbnail_dir, ignore_errors=True)
+                thumbnail_pass((60, 200))
+            phases["thumbnails_cold"], _ = timed(cold_thumbnails, repeat)
+            phases["thumbnails_warm"], _ = timed(lambda: thumbnail_pass((60, 200)), repeat)
+
+    ids = list(index.entries)
+    connectors = [f"DP-{i}" for i in range(screens)]
+    config_data = {"fps": 30, "fill": True}
+    config_data["assignments"] = {connectors[i]: {"ID": ids[i % len(ids)]} for i in range(screens)}
+    def build_apply(rounds=10000):
+        for _ in range(rounds):
+            specs = screen_specs(config_data, connectors)
+            build_args("/usr/bin/linux-wallpaperengine", specs)
+            plan_apply(specs, {})
+    phases["apply_argv_x10000"], _ = timed(build_apply, repeat)
+
+    return phases, dict(tracer.counters), len(entries)
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def compare(results, baseline):
+    print(f"{'phase':<22} {'baseline s':>11} {'current s':>11} {'change':>8}")
+    for name, phase in results["phases"].items():
+        old = baseline.get("phases", {}).get(name)
+        if not old:
+            print(f"{name:<22} {'-':>11} {phase['best']:>11.4f}")
+            continue
+        change = (phase["best"] / old["best"] - 1) * 100 if old["best"] else 0
+        print(f"{name:<22} {old['best']:>11.4f} {phase['best']:>11.4f} {change:>+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=3000, help="wallpapers in the generated workshop")
+    parser.add_argument("--workshop", help="reuse or keep the generated workshop in this folder")
+    parser.add_argument("--image-size", type=int, default=512, help="preview width and height in pixels")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per phase, the best one is reported")
+    parser.add_argument("--thumbnails", type=int, default=200, help="previews to thumbnail, 0 skips the phase")
+    parser.add_argument("--screens", type=int, default=3, help="screens for the apply argv phase")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="print the change against an earlier results file")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="welg-bench-")
+    try:
+        workshop_dir = args.workshop or os.path.join(scratch, "workshop")
+        if not os.path.isdir(workshop_dir) or not os.listdir(workshop_dir):
+            start = time.perf_counter()
+            generate_workshop(workshop_dir, args.items, args.image_size, seed=args.seed)
+            print(f"Generated {args.items} wallpapers in {time.perf_counter() - start:.1f}s")
+
+        cache_dir = os.path.join(scratch, "cache")
+        os.makedirs(cache_dir)
+        phases, counters, items = run_benchmarks(workshop_dir, cache_dir, args.repeat, args.thumbnails, args.screens)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "items": items,
+        "phases": phases,
+        "counters": counters,
+    }
+
+    for name, phase in phases.items():
+        print(f"{name:<22} best {phase['best']:.4f}s  median {phase['median']:.4f}s")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import atexit
+import copy
+import json
+import os
+import threading
+
+# Use XDG config directory for configs
+XDG_CONFIG_HOME = os.path.expanduser("~/.config")
+CONFIG_DIR = os.path.join(XDG_CONFIG_HOME, "wallpaperengine-linux")
+os.makedirs(CONFIG_DIR, exist_ok=True)
+
+CONFIG_PATH = os.path.join(CONFIG_DIR, "config.json")
+
+IS_FLATPAK = os.path.exists("/.flatpak-info")
+
+# Cached data lives in the XDG cache directory, it can always be rebuilt
+XDG_CACHE_HOME = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+CACHE_DIR = os.path.join(XDG_CACHE_HOME, "wallpaperengine-linux")
+
+class JsonFile:
+    """
+    A JSON file several processes read and write, like config.json or the
+    caches. read_if_changed() skips the parse while the mtime is the one last
+    read or written, write() goes through a per-process temp file and a
+    rename so nobody ever reads a half-written file.
+    """
+
+    def __init__(self, path, name, indent=None):
+        self.path = path
+        # What the file is called in error messages
+        self.name = name
+        self.indent = indent
+        self.mtime = None
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def read(self):
+        """The parsed file, {} if it is missing or unreadable."""
+        self.mtime = self._stat_mtime()
+        if self.mtime is None:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+            print(f"Failed to read {self.name}: not a JSON object")
+        except Exception as e:
+            print(f"Failed to read {self.name}: {e}")
+        return {}
+
+    def read_if_changed(self):
+        """Like read(), but None if the file did not change since it was last read or written."""
+        if self._stat_mtime() == self.mtime:
+            return None
+        return self.read()
+
+    def write(self, data):
+        """Replaces the file with data, returns False if that failed."""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=self.indent)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.mtime = self._stat_mtime()
+            return True
+        except Exception as e:
+            print(f"Failed to write {self.name}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+class ConfigStore:
+    """
+    Keeps config.json parsed in memory.
+
+    The file is only re-read when its mtime changes on disk, and saves are
+    debounced so clicking through many wallpapers ends in a single write.
+    """
+
+    def __init__(self, path, write_delay=0.5):
+        self.file = JsonFile(path, "config.json", indent=2)
+        self.write_delay = write_delay
+        self.data = {}
+        self.timer = None
+        self.lock = threading.RLock()
+        atexit.register(self.flush)
+
+    def get(self):
+        """Returns a copy of the current config, callers can modify it and pass it to save()."""
+        with self.lock:
+            # A pending write means memory is newer than the file
+            if self.timer is None:
+                data = self.file.read_if_changed()
+                if data is not None:
+                    self.data = data
+            return copy.deepcopy(self.data)
+
+    def save(self, config_data):
+        with self.lock:
+            self.data = copy.deepcopy(config_data)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.write_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Writes pending changes to disk right away."""
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer.cancel()
+            self.timer = None
+            self.file.write(self.data)
+
+config_store = ConfigStore(CONFIG_PATH)
+
+def get_config():
+    return config_store.get()
+
+def save_config(config_data):
+    config_store.save(config_data)
+
+def get_walls_path():
+    config_data = get_config()
+    return config_data.get("path", None)
+
+def screen_assignments(config_data, screens=None):
+    """
+    Maps connector names (DP-1, HDMI-A-1, ...) to wallpaper IDs. Configs
+    from before "assignments" keyed screens "0", "1", ... by monitor order,
+    those are resolved through the order the GUI saved last ("screens") or
+    the screens passed in.
+    """
+    assignments = {
+        connector: assignment.get("ID")
+        for connector, assignment in (config_data.get("assignments") or {}).items()
+        if isinstance(assignment, dict) and assignment.get("ID")
+    }
+    for i, connector in enumerate(config_data.get("screens") or screens or []):
+        legacy = config_data.get(str(i))
+        if connector and connector not in assignments and isinstance(legacy, dict) and legacy.get("ID"):
+            assignments[connector] = legacy["ID"]
+    return assignments
+
+def migrate_assignments(config_data, screens=None):
+    """Moves "0", "1", ... keys over to "assignments", returns True if there were any."""
+    legacy_keys = [key for key in config_data if key.isdigit()]
+    if not legacy_keys:
+        return False
+    assignments = screen_assignments(config_data, screens)
+    for key in legacy_keys:
+        del config_data[key]
+    config_data["assignments"] = {screen_id: {"ID": bg_id} for screen_id, bg_id in assignments.items()}
+    return True
+
+def assign_wallpaper(config_data, connector, wallpaper_id, screens=None):
+    """Sets the wallpaper of connector in config_data, wallpaper_id None clears it."""
+    migrate_assignments(config_data, screens)
+    assignments = config_data.setdefault("assignments", {})
+    if wallpaper_id:
+        assignments[connector] = {"ID": wallpaper_id}
+    else:
+        assignments.pop(connector, None)
+
+def get_workshop_dirs(config_data=None):
+    """
+    Every workshop folder to scan, in priority order: the configured "path"
+    (a single folder or a list), then the Steam libraries listed in
+    libraryfolders.vdf unless "steam_libraries" is false. A wallpaper that
+    exists in several folders is taken from the first one.
+    """
+    if config_data is None:
+        config_data = get_config()
+
+    paths = config_data.get("path") or []
+    if isinstance(paths, str):
+        paths = [paths]
+    paths = [os.path.expanduser(path) for path in paths if path]
+    if config_data.get("steam_libraries", True):
+        from steam import discover_workshop_dirs
+        paths += discover_workshop_dirs()
+
+    # The same folder is often reachable through ~/.steam/steam and ~/.local/share/Steam
+    dirs, seen = [], set()
+    for path in paths:
+        real_path = os.path.realpath(path)
+        if real_path not in seen:
+            seen.add(real_path)
+            dirs.append(path)
+    return dirs
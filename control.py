@@ -0,0 +1,67 @@
+import json
+import os
+import socket
+
+from engine import RUNTIME_DIR
+
+SOCKET_PATH = os.path.join(RUNTIME_DIR, "control.sock")
+
+# Seconds a client waits for the daemon to accept and answer, a stop alone may take 4
+CONNECT_TIMEOUT = 2.0
+REQUEST_TIMEOUT = 30.0
+
+# Commands the client waits for as long as they take
+LONG_COMMANDS = ("bench",)
+
+def daemon_listening(socket_path=SOCKET_PATH):
+    """True if a `welg --daemon` accepts connections on socket_path."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+def request(command, args=(), socket_path=SOCKET_PATH, timeout=REQUEST_TIMEOUT):
+    """
+    Sends one command to a running `welg --daemon` and returns (ok, output).
+    Returns None when no daemon is listening, callers then do the work
+    themselves. timeout None waits for as long as the command takes.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+
+    with sock:
+        sock.settimeout(timeout)
+        try:
+            sock.sendall(json.dumps({"command": command, "args": list(args)}).encode("utf-8") + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            data = b""
+            while chunk := sock.recv(65536):
+                data += chunk
+            response = json.loads(data)
+        except socket.timeout:
+            print(f"The daemon did not answer {command} within {timeout:g}s")
+            return False, ""
+        except (OSError, ValueError) as e:
+            print(f"Failed to talk to the daemon: {e}")
+            return False, ""
+    return response.get("ok", False), response.get("output", "")
+
+def run_command(command, args=()):
+    """Runs command on the daemon if one is running, in this process otherwise. Returns True on success."""
+    result = request(command, args, timeout=None if command in LONG_COMMANDS else REQUEST_TIMEOUT)
+    if result is None:
+        from daemon import WallpaperDaemon
+        return WallpaperDaemon().handle(command, args)
+
+    ok, output = result
+    print(output, end="")
+    return ok
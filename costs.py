@@ -0,0 +1,164 @@
+import os
+import time
+
+from config import CACHE_DIR, JsonFile
+from engine import build_screen_args
+
+COSTS_PATH = os.path.join(CACHE_DIR, "costs.json")
+
+# Seconds an engine runs before it is measured (loading is not steady state) and
+# how long it is measured, config.json "bench_warmup" and "bench_duration"
+DEFAULT_WARMUP = 10
+DEFAULT_DURATION = 10
+SAMPLE_INTERVAL = 1.0
+
+# CPU percent of one core up to which a wallpaper counts as light or medium
+COST_TIERS = (("light", 10), ("medium", 30), ("heavy", None))
+
+def read_stat(pid, proc_root="/proc"):
+    """(state, ppid, CPU clock ticks) of pid, None if it is gone."""
+    try:
+        with open(os.path.join(proc_root, str(pid), "stat"), "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rfind(b")") + 2:].split()
+    try:
+        return fields[0].decode(), int(fields[1]), int(fields[11]) + int(fields[12])
+    except (IndexError, ValueError):
+        return None
+
+def process_tree(pid, proc_root="/proc"):
+    """pid and all its descendants, web wallpapers run in CEF helper processes."""
+    children = {}
+    for entry in os.listdir(proc_root):
+        if entry.isdigit():
+            stat = read_stat(entry, proc_root)
+            if stat:
+                children.setdefault(stat[1], []).append(int(entry))
+
+    tree = [pid]
+    for parent in tree:
+        tree += children.get(parent, [])
+    return tree
+
+def tree_usage(pid, proc_root="/proc"):
+    """(CPU seconds, RSS bytes) of pid and its descendants, None once pid exited."""
+    stat = read_stat(pid, proc_root)
+    if stat is None or stat[0] == "Z":
+        return None
+
+    ticks = rss = 0
+    for member in process_tree(pid, proc_root):
+        stat = read_stat(member, proc_root)
+        if stat is None:
+            continue
+        ticks += stat[2]
+        try:
+            with open(os.path.join(proc_root, str(member), "statm"), "rb") as f:
+                rss += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            pass
+    return ticks / os.sysconf("SC_CLK_TCK"), rss
+
+def sample_process(pid, warmup, duration, interval=SAMPLE_INTERVAL, proc_root="/proc"):
+    """
+    Waits warmup seconds, then measures pid and its children for duration
+    seconds. Returns {"cpu_percent", "rss", "rss_max"}, None if pid exited
+    before the measurement was done.
+    """
+    time.sleep(max(0, warmup))
+    start_usage = tree_usage(pid, proc_root)
+    start = time.monotonic()
+    if start_usage is None:
+        return None
+
+    rss = []
+    while True:
+        left = duration - (time.monotonic() - start)
+        if left <= 0 and rss:
+            break
+        time.sleep(min(interval, max(left, 0)))
+        usage = tree_usage(pid, proc_root)
+        if usage is None:
+            return None
+        rss.append(usage[1])
+
+    elapsed = time.monotonic() - start
+    return {
+        "cpu_percent": round((usage[0] - start_usage[0]) / elapsed * 100, 1) if elapsed > 0 else 0.0,
+        "rss": sum(rss) // len(rss),
+        "rss_max": max(rss),
+    }
+
+def bench_wallpaper(supervisor, engine_path, screen_id, spec, warmup, duration):
+    """Runs spec on screen_id alone and measures it, returns the result or None if the engine exited."""
+    proc = supervisor.launch(build_screen_args(engine_path, screen_id, spec), screen=screen_id, spec=spec)
+    try:
+        result = sample_process(proc.pid, warmup, duration)
+        log = supervisor.logs.get(proc.pid)
+        if log is not None:
+            log.poll()
+        if result is not None:
+            result["load_ms"] = log.counters.get("load_ms") if log else None
+        return result
+    finally:
+        supervisor.stop([proc.pid])
+
+def cost_tier(cost):
+    """Name of the COST_TIERS entry cost falls in, None if it was never measured."""
+    if cost is None:
+        return None
+    for name, limit in COST_TIERS:
+        if limit is None or cost["cpu_percent"] < limit:
+            return name
+
+def describe_cost(cost):
+    line = f"{cost['cpu_percent']:.1f}% CPU, {cost['rss'] / (1024 * 1024):.0f} MB"
+    if cost.get("load_ms") is not None:
+        line += f", loads in {cost['load_ms']:.0f} ms"
+    return line
+
+def fps_key(fps):
+    return str(fps) if fps else "default"
+
+class CostStore:
+    """
+    Measured cost of each wallpaper per fps setting, kept in COSTS_PATH and
+    re-read when the file changes, so the GUI picks up what a benchmark
+    run by the daemon or the CLI measured.
+    """
+
+    def __init__(self, path=COSTS_PATH):
+        self.file = JsonFile(path, "wallpaper costs", indent=2)
+        self.results = {}
+        self.load()
+
+    def load(self):
+        """Re-reads the file if it changed, returns True if it did."""
+        data = self.file.read_if_changed()
+        if data is None:
+            return False
+        self.results = data.get("results", {})
+        return True
+
+    def save(self):
+        self.file.write({"results": self.results})
+
+    def record(self, wallpaper_id, fps, result):
+        self.load()
+        self.results.setdefault(wallpaper_id, {})[fps_key(fps)] = dict(result, measured=time.time())
+        self.save()
+
+    def get(self, wallpaper_id, fps=None):
+        """The cost of wallpaper_id at fps, else its latest measurement at any fps."""
+        by_fps = self.results.get(wallpaper_id)
+        if not by_fps:
+            return None
+        if fps_key(fps) in by_fps:
+            return by_fps[fps_key(fps)]
+        return max(by_fps.values(), key=lambda cost: cost.get("measured", 0))
+
+    def costs(self, fps=None):
+        """Maps every measured wallpaper ID to its cost at fps."""
+        return {wallpaper_id: self.get(wallpaper_id, fps) for wallpaper_id in self.results}
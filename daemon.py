@@ -0,0 +1,464 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import inspect
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from config import assign_wallpaper, config_store, get_config, get_workshop_dirs, save_config
+from control import LONG_COMMANDS, SOCKET_PATH, daemon_listening
+from displays import HOTPLUG_INTERVAL, HOTPLUG_SETTLE_SAMPLES, connected_screens, get_screens
+from costs import DEFAULT_DURATION, DEFAULT_WARMUP, CostStore, bench_wallpaper, describe_cost, sample_process
+from engine import EngineSupervisor, apply_wallpapers, engine_path_from_config, prepare_engine_env, screen_specs
+from governor import DEFAULT_INTERVAL, FpsGovernor
+from preflight import PreflightCache
+from watchdog import WATCH_INTERVAL, CrashLog, EngineWatchdog
+
+# What other clients are told the daemon is doing while one of LONG_COMMANDS runs
+BUSY_REASONS = {"bench": "benchmarking wallpapers"}
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+class CapturedStdout(io.TextIOBase):
+    """
+    Stands in for sys.stdout in the daemon. Everything goes to the real
+    stdout, and what a command prints also goes to its client's reply.
+    Captures are per thread, so background threads never end up in a reply.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def write(self, text):
+        sys.__stdout__.write(text)
+        capture = getattr(self.local, "capture", None)
+        if capture is not None:
+            capture.write(text)
+        return len(text)
+
+    def flush(self):
+        sys.__stdout__.flush()
+
+    @contextlib.contextmanager
+    def capture(self):
+        buffer = io.StringIO()
+        self.local.capture = buffer
+        try:
+            yield buffer
+        finally:
+            self.local.capture = None
+
+class WallpaperDaemon:
+    """
+    State that `welg` otherwise rebuilds on every run: the parsed config,
+    the library index and the handles of the engines it started.
+
+    handle() runs one command and prints its output. `welg --daemon` serves
+    it on SOCKET_PATH, without a daemon the CLI runs the same commands in
+    its own process.
+    """
+
+    def __init__(self):
+        self.supervisor = EngineSupervisor()
+        self.library = None
+        self.started = None
+        self.governor = None
+        self.watchdog = None
+        # What a LONG_COMMANDS command keeps the daemon busy with, other clients shouldn't wait for it
+        self.busy = None
+        self.busy_lock = threading.Lock()
+        # Commands, the fps governor and the watchdog take turns
+        self.lock = threading.RLock()
+
+    def config(self):
+        """config.json with the fps the governor picked, if it runs."""
+        config_data = get_config()
+        if self.governor is not None:
+            config_data["fps"] = self.governor.fps(config_data.get("fps"))
+        return config_data
+
+    def library_index(self):
+        if self.library is None:
+            from library import LibraryIndex
+            self.library = LibraryIndex()
+        return self.library
+
+    def claim(self, command):
+        """
+        What the daemon is busy with, None if it is free. A free daemon is
+        marked busy right away for LONG_COMMANDS, until release().
+        """
+        with self.busy_lock:
+            if self.busy is None and command in LONG_COMMANDS:
+                self.busy = BUSY_REASONS.get(command, f"running {command}")
+                return None
+            return self.busy
+
+    def release(self):
+        with self.busy_lock:
+            self.busy = None
+
+    def handle(self, command, args=()):
+        handler = getattr(self, "cmd_" + command.replace("-", "_"), None)
+        if handler is None:
+            print(f"Unknown command {command}")
+            return False
+        try:
+            inspect.signature(handler).bind(*args)
+        except TypeError:
+            print(f"Wrong arguments for {command}: {' '.join(args)}")
+            return False
+        try:
+            with self.lock:
+                return bool(handler(*args))
+        except Exception as e:
+            print(f"{command} failed: {e}")
+            return False
+
+    def cmd_apply(self, *args):
+        config_data = self.config()
+        dry_run = "--dry-run" in args
+        elapsed = apply_wallpapers(self.supervisor, config_data, get_screens(config_data), dry_run)
+        return dry_run or elapsed is not None
+
+    def cmd_set(self, screen, wallpaper_id):
+        """Assigns a wallpaper to a screen, given by index or connector name."""
+        config_data = get_config()
+        screens = config_data.get("screens") or get_screens(config_data) or []
+        if screen.isdigit():
+            if int(screen) >= len(screens) or screens[int(screen)] is None:
+                print(f"Unknown screen {screen}")
+                return False
+            connector = screens[int(screen)]
+        else:
+            connector = screen
+            if connector not in screens:
+                print(f"Warning: {connector} is not connected, it gets the wallpaper once it is")
+
+        if self.library is not None and wallpaper_id not in self.library.entries:
+            print(f"Warning: {wallpaper_id} is not in the wallpaper index")
+        # Picking a quarantined wallpaper again means trying it again
+        if CrashLog().release(wallpaper_id):
+            print(f"Released {wallpaper_id} from quarantine")
+
+        assign_wallpaper(config_data, connector, wallpaper_id, screens)
+        save_config(config_data)
+        config_store.flush()
+        print(f"Screen {connector} -> {wallpaper_id}")
+        return True
+
+    def cmd_kill(self):
+        stopped = self.supervisor.stop_all(engine_path_from_config(get_config()))
+        print(f"Stopped {len(stopped)} wallpaper engine processes.")
+        return True
+
+    def cmd_status(self):
+        if self.started is not None:
+            print(f"Daemon running for {format_duration(time.time() - self.started)}")
+        if self.governor is not None:
+            print(self.governor.describe(get_config().get("fps")))
+        for wallpaper_id, info in sorted(CrashLog().quarantined().items()):
+            print(f"Quarantined: {wallpaper_id} ({info['crashes']} crashes, since {time.strftime('%Y-%m-%d %H:%M', time.localtime(info['since']))})")
+        instances = self.supervisor.status()
+        if not instances:
+            print("No engines running")
+            return True
+
+        print(f"{'pid':>8} {'screen':<10} {'wallpaper':<12} {'uptime':>8} {'restarts':>8} {'rss MB':>7} {'cpu s':>8}")
+        for instance in instances:
+            rss = instance.get("rss")
+            cpu = instance.get("cpu_seconds")
+            print(
+                f"{instance['pid']:>8} {instance['screen'] or 'all':<10} {','.join(instance['wallpapers']) or '-':<12} "
+                f"{format_duration(instance['uptime']):>8} {instance['restarts']:>8} "
+                f"{rss / (1024 * 1024) if rss is not None else 0:>7.1f} {cpu if cpu is not None else 0:>8.1f}"
+            )
+            counters = instance["counters"]
+            if counters:
+                reported = ", ".join(
+                    f"{name} {value:g}" for name, value in counters.items()
+                    if isinstance(value, (int, float))
+                )
+                print(f"{'':>8} {reported}")
+            if counters.get("last_error"):
+                print(f"{'':>8} last error: {counters['last_error']}")
+        return True
+
+    def cmd_logs(self, screen=None):
+        """The last lines each engine printed, only the engine on screen if given."""
+        for instance in self.supervisor.status():
+            if screen is not None and instance["screen"] != screen:
+                continue
+            print(f"==> {instance['screen'] or 'all'} ({instance['pid']}, {instance['log']})")
+            for line in instance["lines"]:
+                print(line)
+        return True
+
+    def cmd_list(self):
+        from library import wallpaper_type
+        entries = self.library_index().entries
+        # Nothing was scanned yet, e.g. on a fresh install without a daemon
+        if not entries and get_workshop_dirs():
+            self.library.rescan(get_workshop_dirs())
+            entries = self.library.entries
+        config_data = get_config()
+        preflight = PreflightCache.from_config(config_data)
+        costs = CostStore().costs(config_data.get("fps"))
+        for wallpaper_id, entry in sorted(entries.items(), key=lambda item: (item[1].get("title") or "").casefold()):
+            issues = preflight.issues(wallpaper_id)
+            cost = f"\t{describe_cost(costs[wallpaper_id])}" if wallpaper_id in costs else ""
+            warning = f"\t! {'; '.join(issues)}" if issues else ""
+            print(f"{wallpaper_id}\t{wallpaper_type(entry) or '-'}\t{entry.get('title') or ''}{cost}{warning}")
+        return True
+
+    def cmd_bench(self, *wallpaper_ids):
+        """
+        Runs each wallpaper alone on the first screen and records what it
+        costs at the configured fps. Without IDs the running single-wallpaper
+        engines are measured where they are.
+        """
+        config_data = get_config()
+        warmup = config_data.get("bench_warmup", DEFAULT_WARMUP)
+        duration = config_data.get("bench_duration", DEFAULT_DURATION)
+        fps = config_data.get("fps")
+        store = CostStore()
+        if not wallpaper_ids:
+            # Running engines may be at the fps the governor picked
+            return self.sample_running(store, self.config().get("fps"), warmup, duration)
+
+        engine_path = engine_path_from_config(config_data)
+        if not engine_path:
+            print("Engine path not set in config.json")
+            return False
+        screens = [screen_id for screen_id in get_screens(config_data) or [] if screen_id]
+        if not screens:
+            print("No display found")
+            return False
+        screen_id = screens[0]
+        prepare_engine_env(engine_path)
+
+        # Other engines would skew the numbers, they come back once the batch is done
+        running = bool(self.supervisor.tracked())
+        if running:
+            self.supervisor.stop_all(engine_path)
+        # A supervisor of its own keeps the watchdog from restarting a wallpaper that crashes here
+        bench_supervisor = EngineSupervisor()
+        ok = True
+        try:
+            for i, wallpaper_id in enumerate(wallpaper_ids, 1):
+                spec = screen_specs({**config_data, "assignments": {screen_id: {"ID": wallpaper_id}}}, [screen_id])[screen_id]
+                print(f"[{i}/{len(wallpaper_ids)}] {wallpaper_id} on {screen_id}, {warmup + duration:g}s")
+                try:
+                    result = bench_wallpaper(bench_supervisor, engine_path, screen_id, spec, warmup, duration)
+                except Exception as e:
+                    print("Failed to launch wallpaper engine:", e)
+                    return False
+                if result is None:
+                    print(f"{wallpaper_id}: engine exited before it was measured")
+                    ok = False
+                    continue
+                store.record(wallpaper_id, fps, result)
+                print(f"{wallpaper_id}: {describe_cost(result)}")
+        finally:
+            if running:
+                self.handle("apply")
+        return ok
+
+    def sample_running(self, store, fps, warmup, duration):
+        # An engine drawing several wallpapers can't tell which one costs what
+        instances = [instance for instance in self.supervisor.status() if len(instance["wallpapers"]) == 1]
+        if not instances:
+            print("No engine with a single wallpaper running, use per-screen mode or pass wallpaper IDs")
+            return False
+
+        # Measured side by side, each after the rest of its warm-up
+        with ThreadPoolExecutor(max_workers=len(instances)) as pool:
+            futures = {
+                pool.submit(sample_process, instance["pid"], warmup - instance["uptime"], duration): instance
+                for instance in instances
+            }
+            for future, instance in futures.items():
+                wallpaper_id = instance["wallpapers"][0]
+                result = future.result()
+                if result is None:
+                    print(f"{wallpaper_id}: engine exited before it was measured")
+                    continue
+                result["load_ms"] = instance["counters"].get("load_ms")
+                store.record(wallpaper_id, fps, result)
+                print(f"{wallpaper_id} on {instance['screen']}: {describe_cost(result)}")
+        return True
+
+    def run_governor(self, interval):
+        """Samples the system every interval seconds and re-applies when the fps tier changes."""
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                pids = list(self.supervisor.tracked())
+                base_fps = get_config().get("fps")
+                fps = self.governor.fps(base_fps)
+                if not self.governor.update(pids, base_fps):
+                    continue
+                print(self.governor.describe(base_fps))
+                # Engines the user stopped stay stopped, and a rule above the configured fps changes nothing
+                if pids and self.governor.fps(base_fps) != fps:
+                    self.handle("apply")
+
+    def run_watchdog(self, interval):
+        """Reaps and restarts crashed engines and rotates engine logs every interval seconds."""
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                if self.watchdog is not None:
+                    self.watchdog.poll()
+                # The logs live in the runtime dir, which is usually RAM
+                self.supervisor.rotate_logs()
+
+    def run_hotplug(self, interval):
+        """
+        Polls the connected screens every interval seconds. Once a change held
+        for HOTPLUG_SETTLE_SAMPLES polls, applies again, which in per-screen
+        mode only starts or stops the engines of the screens that came or went.
+        """
+        connected = connected_screens(get_screens(get_config()))
+        pending, samples = None, 0
+        while True:
+            time.sleep(interval)
+            screens = connected_screens(get_screens(get_config()))
+            if screens == connected:
+                pending, samples = None, 0
+                continue
+            if screens != pending:
+                pending, samples = screens, 0
+            samples += 1
+            if samples < HOTPLUG_SETTLE_SAMPLES:
+                continue
+
+            with self.lock:
+                print(f"Screens changed: {' '.join(sorted(screens - connected)) or '-'} connected, "
+                      f"{' '.join(sorted(connected - screens)) or '-'} disconnected")
+                connected, pending, samples = screens, None, 0
+                # Engines the user stopped stay stopped
+                if self.supervisor.tracked():
+                    self.handle("apply")
+
+    def cmd_rescan(self):
+        workshop_dirs = get_workshop_dirs()
+        if not workshop_dirs:
+            print("Workshop path not set in config.json")
+            return False
+        added, changed, removed = self.library_index().rescan(workshop_dirs)
+        print(f"{len(added)} added, {len(changed)} changed, {len(removed)} removed")
+        # Inspect packages in the background, apply warns from what is cached by then
+        threading.Thread(
+            target=self.run_preflight,
+            args=(dict(self.library.entries),),
+            name="preflight",
+            daemon=True,
+        ).start()
+        return True
+
+    def run_preflight(self, entries):
+        flagged = PreflightCache.from_config(get_config()).inspect_all(entries)
+        if flagged:
+            print(f"{len(flagged)} wallpapers may not work, see --list")
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+            command = str(message["command"])
+            args = [str(arg) for arg in message.get("args", [])]
+        except (ValueError, KeyError, TypeError):
+            return
+
+        daemon_state = self.server.daemon_state
+        # A benchmark holds the daemon for minutes, don't keep this client waiting behind it
+        busy = daemon_state.claim(command)
+        if busy:
+            response = {"ok": False, "busy": True, "output": f"Daemon is busy {busy}, try again later\n"}
+        else:
+            try:
+                with sys.stdout.capture() as output:
+                    ok = daemon_state.handle(command, args)
+            finally:
+                if command in LONG_COMMANDS:
+                    daemon_state.release()
+            response = {"ok": ok, "output": output.getvalue()}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Each client gets a thread so a busy daemon can still say so, commands
+    # take the daemon's lock and run one at a time
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon_state):
+        self.daemon_state = daemon_state
+        super().__init__(socket_path, ControlHandler)
+
+def serve(socket_path=SOCKET_PATH):
+    """Runs `welg --daemon` until SIGTERM or SIGINT, returns the exit status."""
+    if daemon_listening(socket_path):
+        print(f"A daemon is already listening on {socket_path}")
+        return 1
+    # Nothing listening, a socket file left behind by a crash can go
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(socket_path)
+
+    # Replies capture what their command prints, from here on
+    sys.stdout = CapturedStdout()
+    daemon_state = WallpaperDaemon()
+    daemon_state.handle("rescan")
+    config_data = get_config()
+    daemon_state.governor = FpsGovernor.from_config(config_data)
+    if daemon_state.governor is not None:
+        settings = config_data["fps_governor"] if isinstance(config_data["fps_governor"], dict) else {}
+        threading.Thread(
+            target=daemon_state.run_governor,
+            args=(settings.get("interval", DEFAULT_INTERVAL),),
+            name="fps-governor",
+            daemon=True,
+        ).start()
+    if config_data.get("watchdog", True):
+        daemon_state.watchdog = EngineWatchdog(daemon_state.supervisor, CrashLog.from_config(config_data))
+    threading.Thread(
+        target=daemon_state.run_watchdog,
+        args=(WATCH_INTERVAL,),
+        name="watchdog",
+        daemon=True,
+    ).start()
+    if config_data.get("hotplug", True):
+        threading.Thread(
+            target=daemon_state.run_hotplug,
+            args=(HOTPLUG_INTERVAL,),
+            name="hotplug",
+            daemon=True,
+        ).start()
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    old_umask = os.umask(0o077)
+    try:
+        server = ControlServer(socket_path, daemon_state)
+    finally:
+        os.umask(old_umask)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    daemon_state.started = time.time()
+    print(f"Listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(socket_path)
+        config_store.flush()
+        sys.stdout = sys.__stdout__
+    return 0
@@ -0,0 +1,100 @@
+import os
+
+DRM_PATH = "/sys/class/drm"
+
+# Monitors come and go in bursts (a dock brings several, DPMS flaps), a change
+# is only acted on once it held this long in the GUI...
+HOTPLUG_DEBOUNCE_MS = 1500
+# ...or for this many polls, HOTPLUG_INTERVAL seconds apart, in the daemon
+HOTPLUG_INTERVAL = 2
+HOTPLUG_SETTLE_SAMPLES = 2
+
+def drm_connectors(drm_path=DRM_PATH):
+    """
+    Connected outputs read from sysfs, named like the compositor names them
+    (DP-1, HDMI-A-1, eDP-1). Works without a display server or GTK.
+    """
+    connectors = []
+    try:
+        names = sorted(os.listdir(drm_path))
+    except OSError:
+        return None
+
+    for name in names:
+        # Connector folders look like card1-DP-1, render nodes and cards themselves have no dash
+        card, sep, connector = name.partition("-")
+        if not sep or not card.startswith("card"):
+            continue
+        try:
+            with open(os.path.join(drm_path, name, "status"), "r", encoding="utf-8") as f:
+                if f.read().strip() != "connected":
+                    continue
+        except OSError:
+            continue
+        connectors.append(connector)
+    return connectors
+
+def monitor_connector(monitor, i):
+    screen_id = None
+    if hasattr(monitor, "get_connector"):
+        screen_id = monitor.get_connector()
+    if not screen_id and hasattr(monitor, "get_physical_monitor"):
+        phys = monitor.get_physical_monitor()
+        if phys and hasattr(phys, "get_name"):
+            screen_id = phys.get_name()
+    if not screen_id and hasattr(monitor, "get_name"):
+        screen_id = monitor.get_name()
+    if not screen_id:
+        screen_id = f"Screen{i}"
+    return screen_id
+
+def gdk_connectors():
+    """Connector names in the order GDK lists the monitors, None without a display."""
+    import gi
+    gi.require_version('Gdk', '4.0')
+    from gi.repository import Gdk
+
+    display = Gdk.Display.get_default()
+    if not display:
+        return None
+
+    monitors = display.get_monitors()
+    return [monitor_connector(monitors.get_item(i), i) for i in range(monitors.get_n_items())]
+
+def drm_screens(config_data):
+    """
+    Screens for headless use. Old "0", "1", ... keys in config.json and
+    `--set 0 ID` follow the monitor order the GUI last saw (saved as
+    "screens"), so that order is kept and DRM only tells which of those
+    outputs are connected right now. Disconnected outputs stay in the list
+    as None to keep the indices stable.
+    """
+    known = list(config_data.get("screens") or [])
+    connected = drm_connectors()
+    if connected is None:
+        return known or None
+
+    # X11 names outputs differently than DRM does, then the saved list is all we have
+    if known and not set(known) & set(connected):
+        return known
+
+    screens = [screen_id if screen_id in connected else None for screen_id in known]
+    screens += [screen_id for screen_id in connected if screen_id not in known]
+    return screens
+
+SCREEN_BACKENDS = {
+    "drm": drm_screens,
+    "gdk": lambda config_data: gdk_connectors(),
+}
+
+def connected_screens(screens):
+    """Connector names of the connected screens in a get_screens() list, as a set."""
+    return {screen_id for screen_id in screens or [] if screen_id is not None}
+
+def get_screens(config_data, backend=None):
+    """Lists screens with the backend picked by "screen_backend" in config.json (drm by default)."""
+    backend = backend or config_data.get("screen_backend", "drm")
+    if backend not in SCREEN_BACKENDS:
+        print(f"Unknown screen backend {backend}, using drm")
+        backend = "drm"
+    return SCREEN_BACKENDS[backend](config_data)
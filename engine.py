@@ -0,0 +1,522 @@
+import fcntl
+import json
+import os
+import select
+import signal
+import subprocess
+import time
+
+from config import CACHE_DIR, IS_FLATPAK, screen_assignments
+from engine_log import DEFAULT_ENGINE_LOG_KB, EngineLog, rotate_log
+from preflight import PreflightCache
+from tracing import tracer
+from watchdog import CrashLog, engine_wallpapers
+
+# PIDs are only meaningful until reboot, so they go to the runtime dir when there is one
+_XDG_RUNTIME_DIR = os.environ.get("XDG_RUNTIME_DIR")
+RUNTIME_DIR = os.path.join(_XDG_RUNTIME_DIR, "wallpaperengine-linux") if _XDG_RUNTIME_DIR else CACHE_DIR
+PID_FILE = os.path.join(RUNTIME_DIR, "engine.pids")
+LOG_DIR = os.path.join(RUNTIME_DIR, "logs")
+
+ENGINE_NAME = "linux-wallpaperengine"
+
+# Seconds an engine gets to exit after SIGTERM before it is killed
+STOP_TIMEOUT = 3.0
+KILL_TIMEOUT = 1.0
+
+def process_start_time(pid):
+    """Start time of pid in clock ticks since boot, tells a process apart from a later one reusing its PID."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses, fields start after the last ')'
+    fields = stat[stat.rfind(b")") + 2:].split()
+    try:
+        if fields[0] == b"Z":
+            return None
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+def proc_stats(pid):
+    """Resident memory in bytes and CPU seconds used so far by pid, None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    fields = stat[stat.rfind(b")") + 2:].split()
+    try:
+        cpu_ticks = int(fields[11]) + int(fields[12])
+    except (IndexError, ValueError):
+        return None
+    return {
+        "rss": resident_pages * os.sysconf("SC_PAGE_SIZE"),
+        "cpu_seconds": cpu_ticks / os.sysconf("SC_CLK_TCK"),
+    }
+
+def find_engine_processes(engine_path=None):
+    """
+    PIDs of our user's engine processes, matched on the executable itself
+    rather than on command line substrings. Only used when no PID file exists
+    yet, e.g. for engines started by an older version.
+    """
+    names = {ENGINE_NAME}
+    if engine_path:
+        names.add(os.path.basename(engine_path))
+
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            exe = os.readlink(f"/proc/{entry}/exe")
+        except OSError:
+            continue
+        if os.path.basename(exe.removesuffix(" (deleted)")) in names:
+            pids.append(int(entry))
+    return pids
+
+def open_pidfd(pid):
+    try:
+        return os.pidfd_open(pid)
+    except ProcessLookupError:
+        return -1
+    except (AttributeError, OSError):
+        # Python < 3.9 or kernel < 5.3
+        return None
+
+def send_signal(pid, pidfd, sig):
+    try:
+        if pidfd is not None and pidfd >= 0:
+            signal.pidfd_send_signal(pidfd, sig)
+        else:
+            os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+class EngineSupervisor:
+    """
+    Starts engine processes and keeps track of them in PID_FILE, so a later
+    `--kill` or `--apply` only ever touches engines we started.
+
+    Stopping sends SIGTERM, waits on pidfds until the processes exited (or
+    STOP_TIMEOUT passed) and only then falls back to SIGKILL, so a new engine
+    never races the old one for the GPU.
+    """
+
+    def __init__(self, pid_file=PID_FILE, log_dir=LOG_DIR):
+        self.pid_file = pid_file
+        self.log_dir = log_dir
+        self.children = {}
+        # Records of the children, they outlive their PID file entry so exits can be reported
+        self.records = {}
+        self.logs = {}
+        # Bumped by every stop, so the watchdog drops restarts planned before
+        self.stop_count = 0
+
+    def _locked(self, update):
+        """Runs update(records) with the PID file locked, writes back what it returns."""
+        os.makedirs(os.path.dirname(self.pid_file), exist_ok=True)
+        with open(self.pid_file, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                records = json.loads(f.read() or "{}")
+            except ValueError:
+                records = {}
+
+            # Forget processes that exited or whose PID now belongs to something else
+            records = {
+                pid: record for pid, record in records.items()
+                if record.get("start_time") is not None and process_start_time(int(pid)) == record.get("start_time")
+            }
+            new_records = update(records)
+            if new_records is None:
+                new_records = records
+
+            f.seek(0)
+            f.truncate()
+            json.dump(new_records, f, indent=2)
+            return new_records
+
+    def has_pid_file(self):
+        return os.path.isfile(self.pid_file)
+
+    def tracked(self):
+        """Maps the PIDs of running engines we started to their records."""
+        try:
+            return {int(pid): record for pid, record in self._locked(lambda records: None).items()}
+        except OSError as e:
+            print(f"Failed to read {self.pid_file}: {e}")
+            return {}
+
+    def open_log(self, screen, args, log_max_bytes):
+        """Opens the log an engine writes to, returns (file, path, offset of this run's output)."""
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = os.path.join(self.log_dir, f"{screen or 'all'}.log")
+        rotate_log(path, log_max_bytes)
+        log_file = open(path, "ab")
+        log_file.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} {' '.join(args)}\n".encode("utf-8"))
+        log_file.flush()
+        return log_file, path, log_file.tell()
+
+    def launch(self, args, screen=None, spec=None, log_max_bytes=DEFAULT_ENGINE_LOG_KB * 1024, restarts=0, **popen_kwargs):
+        """
+        Starts an engine, screen and spec identify per-screen instances. Its
+        output goes to a log in log_dir, unless log_max_bytes is 0 or the
+        caller redirects stdout itself. restarts counts the crashes the
+        watchdog restarted it after, an apply starts over at 0.
+        """
+        log_file, log_path, log_offset = None, None, 0
+        if log_max_bytes and "stdout" not in popen_kwargs:
+            try:
+                log_file, log_path, log_offset = self.open_log(screen, args, log_max_bytes)
+                popen_kwargs.update(stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT)
+            except OSError as e:
+                print(f"Failed to open engine log: {e}")
+
+        try:
+            with tracer.span("launch engine", screen=screen):
+                proc = subprocess.Popen(args, **popen_kwargs)
+        finally:
+            # The engine has its own descriptor now
+            if log_file:
+                log_file.close()
+        tracer.count("engines launched")
+        self.children[proc.pid] = proc
+        record = {
+            "start_time": process_start_time(proc.pid),
+            "args": args,
+            "started": time.time(),
+            "screen": screen,
+            "spec": spec,
+            "restarts": restarts,
+            "log": log_path,
+            "log_offset": log_offset,
+            "log_max_bytes": log_max_bytes,
+        }
+        if log_path:
+            self.logs[proc.pid] = EngineLog(log_path, log_offset)
+        self.records[proc.pid] = record
+
+        def add(records):
+            records[str(proc.pid)] = record
+            return records
+
+        # Gone before its start time could be read, its PID may belong to something else soon
+        if record["start_time"] is None:
+            return proc
+        try:
+            self._locked(add)
+        except OSError as e:
+            print(f"Failed to write {self.pid_file}: {e}")
+        return proc
+
+    def _forget(self, pids):
+        pids = {str(pid) for pid in pids}
+        try:
+            self._locked(lambda records: {pid: r for pid, r in records.items() if pid not in pids})
+        except OSError as e:
+            print(f"Failed to write {self.pid_file}: {e}")
+
+    def reap(self):
+        """(pid, returncode, record) of every child that exited since the last call, stopped ones aside."""
+        exited = []
+        for pid, proc in list(self.children.items()):
+            returncode = proc.poll()
+            if returncode is None:
+                continue
+            del self.children[pid]
+            self.logs.pop(pid, None)
+            record = self.records.pop(pid, None)
+            if record is not None:
+                exited.append((pid, returncode, record))
+        if exited:
+            self._forget(pid for pid, returncode, record in exited)
+        return exited
+
+    def _exited(self, pid):
+        proc = self.children.get(pid)
+        if proc is not None:
+            return proc.poll() is not None
+        return process_start_time(pid) is None
+
+    def _wait(self, pids, pidfds, timeout):
+        """Waits until all pids exited or timeout passed, returns the ones still running."""
+        deadline = time.monotonic() + timeout
+        remaining = [pid for pid in pids if not self._exited(pid)]
+        while remaining:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+
+            poll_fds = [pidfds[pid] for pid in remaining if pidfds.get(pid) is not None and pidfds[pid] >= 0]
+            if len(poll_fds) == len(remaining):
+                # A pidfd becomes readable once its process exited
+                poller = select.poll()
+                for fd in poll_fds:
+                    poller.register(fd, select.POLLIN)
+                poller.poll(left * 1000)
+            else:
+                time.sleep(min(0.02, left))
+            remaining = [pid for pid in remaining if not self._exited(pid)]
+        return remaining
+
+    def stop(self, pids, timeout=STOP_TIMEOUT):
+        """Stops pids with SIGTERM, then SIGKILL after timeout. Returns the PIDs that were stopped."""
+        self.stop_count += 1
+        with tracer.span("stop engines"):
+            return self._stop(pids, timeout)
+
+    def _stop(self, pids, timeout):
+        pids = [pid for pid in pids if not self._exited(pid)]
+        if not pids:
+            return []
+
+        tracer.count("engines stopped", len(pids))
+        pidfds = {pid: open_pidfd(pid) for pid in pids}
+        try:
+            for pid in pids:
+                send_signal(pid, pidfds[pid], signal.SIGTERM)
+            remaining = self._wait(pids, pidfds, timeout)
+
+            if remaining:
+                print(f"Engine did not exit after {timeout:.1f}s, killing {remaining}")
+                for pid in remaining:
+                    send_signal(pid, pidfds[pid], signal.SIGKILL)
+                remaining = self._wait(remaining, pidfds, KILL_TIMEOUT)
+        finally:
+            for fd in pidfds.values():
+                if fd is not None and fd >= 0:
+                    os.close(fd)
+
+        for pid in pids:
+            self.children.pop(pid, None)
+            self.records.pop(pid, None)
+            self.logs.pop(pid, None)
+        self._forget(pids)
+        return [pid for pid in pids if pid not in remaining]
+
+    def stop_all(self, engine_path=None, timeout=STOP_TIMEOUT):
+        """Stops every engine we started, returns the PIDs that were stopped."""
+        legacy = not self.has_pid_file()
+        pids = set(self.tracked())
+        pids |= {pid for pid, proc in self.children.items() if proc.poll() is None}
+        if legacy:
+            # No PID file yet, look for engines started before PIDs were tracked
+            pids |= set(find_engine_processes(engine_path))
+        return self.stop(sorted(pids), timeout)
+
+    def instances(self):
+        """Maps screens to (pid, spec) of the running per-screen engines."""
+        return {
+            record["screen"]: (pid, record.get("spec"))
+            for pid, record in self.tracked().items()
+            if record.get("screen")
+        }
+
+    def status(self):
+        """
+        One dict per running engine with its screen, wallpapers, uptime,
+        restart count, RSS and CPU time from /proc and what its log reported.
+        """
+        instances = []
+        for pid, record in sorted(self.tracked().items()):
+            log = self.logs.get(pid)
+            if log is None and record.get("log"):
+                log = self.logs[pid] = EngineLog(record["log"], record.get("log_offset", 0))
+            if log is not None:
+                log.poll()
+
+            args = record.get("args") or []
+            instances.append({
+                "pid": pid,
+                "screen": record.get("screen"),
+                # Engines for all screens carry one --bg per screen
+                "wallpapers": engine_wallpapers(args),
+                "uptime": time.time() - record.get("started", time.time()),
+                "restarts": record.get("restarts", 0),
+                **(proc_stats(pid) or {}),
+                "counters": dict(log.counters) if log else {},
+                "lines": list(log.lines) if log else [],
+                "log": record.get("log"),
+            })
+        return instances
+
+    def rotate_logs(self):
+        """Rotates the logs of the running engines that outgrew their limit, run this periodically."""
+        for record in self.tracked().values():
+            if record.get("log") and record.get("log_max_bytes"):
+                rotate_log(record["log"], record["log_max_bytes"])
+
+    def plan(self, specs):
+        return plan_apply(specs, self.instances())
+
+    def apply_plan(self, engine_path, specs, plan, timeout=STOP_TIMEOUT, log_max_bytes=DEFAULT_ENGINE_LOG_KB * 1024):
+        """
+        Runs one engine per screen, only touching the screens plan says
+        changed. Engines drawing on all screens at once are replaced too.
+        """
+        instances = self.instances()
+        pids = [instances[screen_id][0] for screen_id in plan["restart"] + plan["stop"]]
+        pids += [pid for pid, record in self.tracked().items() if not record.get("screen")]
+        self.stop(pids, timeout)
+
+        for screen_id in plan["restart"] + plan["start"]:
+            spec = specs[screen_id]
+            self.launch(build_screen_args(engine_path, screen_id, spec), screen=screen_id, spec=spec, log_max_bytes=log_max_bytes)
+
+def screen_specs(config_data, screens, quarantined=()):
+    """
+    Maps the connector name of every connected screen with a wallpaper to
+    what its engine should run. screens lists connector names, None for
+    known screens that are disconnected right now. Screens showing a
+    quarantined wallpaper are left out.
+    """
+    fps = config_data.get("fps", None)
+    fill = config_data.get("fill", False)
+    assignments = screen_assignments(config_data, screens)
+
+    specs = {}
+    for screen_id in screens:
+        if screen_id is None:
+            continue
+        bg_id = assignments.get(screen_id)
+        if bg_id and bg_id not in quarantined:
+            specs[screen_id] = {
+                "bg": bg_id,
+                "fps": str(fps) if fps else None,
+                "scaling": "fill" if fill else None,
+            }
+    return specs
+
+def spec_options(spec):
+    args = []
+    if spec.get("fps"):
+        args += ["--fps", spec["fps"]]
+    if spec.get("scaling"):
+        args += ["--scaling", spec["scaling"]]
+    return args
+
+def build_args(engine_path, specs):
+    """argv for a single engine process drawing on every screen."""
+    args = [engine_path]
+    for screen_id, spec in specs.items():
+        args += ["--screen-root", screen_id, "--bg", spec["bg"]]
+    # fps and scaling are global settings, every spec carries the same values
+    if specs:
+        args += spec_options(next(iter(specs.values())))
+    return args
+
+def build_screen_args(engine_path, screen_id, spec):
+    """argv for an engine process that only draws on screen_id."""
+    return [engine_path, "--screen-root", screen_id, "--bg", spec["bg"]] + spec_options(spec)
+
+def plan_apply(specs, instances):
+    """
+    Diffs the desired per-screen specs against the running instances
+    ({screen: (pid, spec)}). Returns a dict with the screens to start,
+    restart, stop and keep.
+    """
+    plan = {"start": [], "restart": [], "stop": [], "keep": []}
+    for screen_id, spec in specs.items():
+        if screen_id not in instances:
+            plan["start"].append(screen_id)
+        elif instances[screen_id][1] != spec:
+            plan["restart"].append(screen_id)
+        else:
+            plan["keep"].append(screen_id)
+    plan["stop"] = [screen_id for screen_id in instances if screen_id not in specs]
+    return plan
+
+def format_plan(plan):
+    lines = []
+    for action in ("keep", "restart", "start", "stop"):
+        for screen_id in plan[action]:
+            lines.append(f"{action:>8} {screen_id}")
+    return "\n".join(lines) or "Nothing to do"
+
+def engine_path_from_config(config_data):
+    if IS_FLATPAK:
+        return "/app/lib/wallpaperengine-linux/linux-wallpaperengine"
+    return config_data.get("engine_path", None)
+
+def prepare_engine_env(engine_path):
+    """Lets an engine built with CEF find the libcef.so next to it."""
+    engine_dir = os.path.dirname(engine_path)
+    if os.path.exists(os.path.join(engine_dir, 'libcef.so')):
+        os.environ['LD_LIBRARY_PATH'] = engine_dir + ':' + os.environ.get('LD_LIBRARY_PATH', '')
+
+def apply_wallpapers(supervisor, config_data, screens, dry_run=False):
+    """
+    Starts the engines for config_data on screens (connector names, None
+    without a display). Shared by the GUI and the GTK-free `--apply`.
+    Returns the seconds it took, None if nothing was applied.
+    """
+    with tracer.span("apply"):
+        return _apply_wallpapers(supervisor, config_data, screens, dry_run)
+
+def _apply_wallpapers(supervisor, config_data, screens, dry_run):
+    engine_path = engine_path_from_config(config_data)
+    per_screen = config_data.get("apply_mode") == "per-screen"
+    log_max_bytes = config_data.get("engine_log_kb", DEFAULT_ENGINE_LOG_KB) * 1024
+    start = time.monotonic()
+
+    # Stop the engines we started and wait for them to exit before starting a new one,
+    # per-screen mode only stops the engines whose screen changed
+    if not per_screen and not dry_run:
+        supervisor.stop_all(engine_path)
+
+    if not engine_path:
+        print("Engine path not set in config.json")
+        return None
+
+    prepare_engine_env(engine_path)
+
+    if screens is None:
+        print("No display found")
+        return None
+
+    quarantined = CrashLog().quarantined()
+    specs = screen_specs(config_data, screens, quarantined)
+    for screen_id, bg_id in screen_assignments(config_data, screens).items():
+        if screen_id in screens and bg_id in quarantined:
+            print(f"Skipping {bg_id} on {screen_id}, it crashed the engine {quarantined[bg_id]['crashes']} times")
+    # Only results cached by a scan, apply never opens packages itself
+    preflight = PreflightCache.from_config(config_data)
+    for screen_id, spec in specs.items():
+        print(f"Screen {screen_id} ID: {spec['bg']}")
+        for issue in preflight.issues(spec["bg"]):
+            print(f"Warning: {spec['bg']} may not work: {issue}")
+
+    if per_screen:
+        plan = supervisor.plan(specs)
+        print(format_plan(plan))
+        if dry_run:
+            return None
+        try:
+            supervisor.apply_plan(engine_path, specs, plan, log_max_bytes=log_max_bytes)
+        except Exception as e:
+            print("Failed to launch wallpaper engine:", e)
+            return None
+    else:
+        args = build_args(engine_path, specs)
+        if dry_run:
+            print("Would stop:", " ".join(str(pid) for pid in sorted(supervisor.tracked())) or "nothing")
+            print("Would run:", " ".join(args))
+            return None
+        print("Running:", " ".join(args))
+        try:
+            supervisor.launch(args, log_max_bytes=log_max_bytes)
+        except Exception as e:
+            print("Failed to launch wallpaper engine:", e)
+            return None
+
+    elapsed = time.monotonic() - start
+    print(f"Applied wallpapers in {elapsed:.2f}s")
+    return elapsed
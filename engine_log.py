@@ -0,0 +1,93 @@
+import collections
+import os
+import re
+import shutil
+
+# Lines of engine output kept in memory per instance
+OUTPUT_LINES = 200
+
+# Size a log may grow to before it is rotated to <log>.1, config.json "engine_log_kb"
+DEFAULT_ENGINE_LOG_KB = 1024
+
+# What the engine prints that is worth counting
+COUNTED_PATTERNS = {
+    "errors": re.compile(r"\b(error|failed|fatal|exception|cannot|couldn't)\b", re.IGNORECASE),
+    "warnings": re.compile(r"\bwarn(ing)?\b", re.IGNORECASE),
+}
+LOAD_TIME_RE = re.compile(r"\b(?:load(?:ed|ing)?|took)\b.*?(\d+(?:\.\d+)?)\s*(ms|s)\b", re.IGNORECASE)
+FPS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*fps\b", re.IGNORECASE)
+FRAME_TIME_RE = re.compile(r"\bframe\b.*?(\d+(?:\.\d+)?)\s*ms\b", re.IGNORECASE)
+
+def rotate_log(path, max_bytes):
+    """
+    Copies path to path.1 and truncates it once it outgrew max_bytes. The
+    engine keeps its O_APPEND descriptor and just continues at the start.
+    """
+    try:
+        if os.path.getsize(path) <= max_bytes:
+            return False
+        shutil.copyfile(path, path + ".1")
+        os.truncate(path, 0)
+        return True
+    except OSError:
+        return False
+
+def parse_line(line, counters):
+    """Adds what line reports to counters."""
+    counters["lines"] = counters.get("lines", 0) + 1
+    for name, pattern in COUNTED_PATTERNS.items():
+        if pattern.search(line):
+            counters[name] = counters.get(name, 0) + 1
+            if name == "errors":
+                counters["last_error"] = line[:200]
+
+    match = LOAD_TIME_RE.search(line)
+    if match:
+        value = float(match.group(1)) * (1000 if match.group(2).lower() == "s" else 1)
+        counters["load_ms"] = value
+    match = FPS_RE.search(line)
+    if match:
+        counters["fps"] = float(match.group(1))
+    match = FRAME_TIME_RE.search(line)
+    if match:
+        frame_ms = float(match.group(1))
+        counters["frame_ms_last"] = frame_ms
+        counters["frame_ms_max"] = max(counters.get("frame_ms_max", 0), frame_ms)
+
+class EngineLog:
+    """
+    Follows the log file an engine writes its stdout and stderr to.
+
+    The engine writes to the file directly, so it never blocks on us and
+    keeps running after we exit. poll() reads whatever was appended since
+    the last call into a bounded ring buffer of lines and structured
+    counters.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.lines = collections.deque(maxlen=OUTPUT_LINES)
+        self.counters = {}
+        self.partial = b""
+
+    def poll(self):
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self.offset:
+                    # Rotated since the last poll
+                    self.offset = 0
+                    self.partial = b""
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+        except OSError:
+            return
+        self.offset += len(data)
+
+        data = self.partial + data
+        *complete, self.partial = data.split(b"\n")
+        for raw in complete:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            self.lines.append(line)
+            parse_line(line, self.counters)
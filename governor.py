@@ -0,0 +1,209 @@
+import os
+import time
+
+# Checked in order, the first rule whose conditions all hold sets the fps.
+# Without a match the engines run at the "fps" from config.json.
+DEFAULT_RULES = [
+    {"on_battery": True, "battery_below": 20, "fps": 5},
+    {"on_battery": True, "fps": 15},
+    {"load_above": 0.8, "fps": 10},
+    {"engine_cpu_above": 50, "fps": 15},
+]
+
+# How far a value has to move back past a threshold before an active rule lets go
+HYSTERESIS = {"battery_below": 5, "load_above": 0.1, "engine_cpu_above": 10}
+
+# Samples a new tier has to be seen in a row before it is applied
+DEFAULT_DWELL = 3
+DEFAULT_INTERVAL = 10
+
+def read_file(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+class SystemState:
+    """
+    Reads what the governor decides on from sysfs and procfs. Both roots can
+    point at a fake tree, so the governor runs without real hardware.
+    """
+
+    def __init__(self, sysfs_root="/sys", proc_root="/proc"):
+        self.sysfs_root = sysfs_root
+        self.proc_root = proc_root
+        self.cpu_samples = {}
+
+    def power(self):
+        """(on_battery, battery percent or None)."""
+        supply_dir = os.path.join(self.sysfs_root, "class", "power_supply")
+        try:
+            names = sorted(os.listdir(supply_dir))
+        except OSError:
+            return False, None
+
+        mains_online, batteries = False, []
+        for name in names:
+            path = os.path.join(supply_dir, name)
+            supply_type = read_file(os.path.join(path, "type"))
+            if supply_type == "Mains" and read_file(os.path.join(path, "online")) == "1":
+                mains_online = True
+            elif supply_type == "Battery":
+                capacity = read_file(os.path.join(path, "capacity"))
+                if capacity and capacity.isdigit():
+                    batteries.append(int(capacity))
+                # Some laptops only say it through the battery status
+                if read_file(os.path.join(path, "status")) in ("Charging", "Full"):
+                    mains_online = True
+
+        if not batteries:
+            return False, None
+        return not mains_online, min(batteries)
+
+    def load(self):
+        """1 minute load average per CPU."""
+        loadavg = read_file(os.path.join(self.proc_root, "loadavg"))
+        try:
+            return float(loadavg.split()[0]) / (os.cpu_count() or 1)
+        except (AttributeError, IndexError, ValueError):
+            return 0.0
+
+    def engine_cpu(self, pids):
+        """CPU used by pids since the last call, in percent of one core."""
+        now = time.monotonic()
+        clock_ticks = os.sysconf("SC_CLK_TCK")
+        total = 0.0
+        samples = {}
+        for pid in pids:
+            stat = read_file(os.path.join(self.proc_root, str(pid), "stat"))
+            if not stat:
+                continue
+            fields = stat[stat.rfind(")") + 2:].split()
+            try:
+                ticks = int(fields[11]) + int(fields[12])
+            except (IndexError, ValueError):
+                continue
+            samples[pid] = (now, ticks)
+            if pid in self.cpu_samples:
+                then, old_ticks = self.cpu_samples[pid]
+                if now > then:
+                    total += (ticks - old_ticks) / clock_ticks / (now - then) * 100
+        self.cpu_samples = samples
+        return total
+
+    def sample(self, pids=()):
+        on_battery, battery = self.power()
+        return {
+            "on_battery": on_battery,
+            "battery": battery,
+            "load": self.load(),
+            "engine_cpu": self.engine_cpu(pids),
+        }
+
+def parse_fps(value):
+    """config.json keeps fps as a string ("25") or a number, None when unset."""
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def rule_matches(rule, state, active=False):
+    """True if all conditions of rule hold, active rules get HYSTERESIS slack."""
+    def slack(condition):
+        return HYSTERESIS.get(condition, 0) if active else 0
+
+    if "on_battery" in rule and state["on_battery"] != rule["on_battery"]:
+        return False
+    if "battery_below" in rule:
+        if state["battery"] is None or state["battery"] >= rule["battery_below"] + slack("battery_below"):
+            return False
+    if "load_above" in rule and state["load"] <= rule["load_above"] - slack("load_above"):
+        return False
+    if "engine_cpu_above" in rule and state["engine_cpu"] <= rule["engine_cpu_above"] - slack("engine_cpu_above"):
+        return False
+    return True
+
+class FpsGovernor:
+    """
+    Picks the fps tier for the engines from the system state.
+
+    A tier is the index of the matching rule (None for the configured fps).
+    update() only reports a new fps once the same tier was chosen for dwell
+    samples in a row, and the active rule keeps matching until its values
+    moved HYSTERESIS past the threshold, so a load hovering around a limit
+    doesn't restart the engines over and over.
+
+    A rule only ever lowers the fps. While a rule throttles the engines,
+    their CPU use is scaled back up to the configured fps before
+    engine_cpu_above is checked, otherwise throttling alone would make the
+    rule let go and the tiers would flip back and forth.
+    """
+
+    def __init__(self, rules=None, dwell=DEFAULT_DWELL, state=None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.dwell = dwell
+        self.state = state or SystemState()
+        self.tier = None
+        self.candidate = None
+        self.candidate_samples = 0
+        self.last_sample = None
+
+    @classmethod
+    def from_config(cls, config_data, state=None):
+        """The governor configured by "fps_governor" in config.json, None if it is off."""
+        settings = config_data.get("fps_governor")
+        if not settings:
+            return None
+        if settings is True:
+            settings = {}
+        if not settings.get("enabled", True):
+            return None
+        return cls(settings.get("rules"), settings.get("dwell", DEFAULT_DWELL), state)
+
+    def choose(self, sample, base_fps=None):
+        base, current = parse_fps(base_fps), parse_fps(self.fps(base_fps))
+        if base and current and current < base:
+            sample = dict(sample, engine_cpu=sample["engine_cpu"] * base / current)
+        for tier, rule in enumerate(self.rules):
+            if rule_matches(rule, sample, active=tier == self.tier):
+                return tier
+        return None
+
+    def fps(self, base_fps):
+        """The fps engines should run at right now, base_fps when no rule is active."""
+        if self.tier is None or "fps" not in self.rules[self.tier]:
+            return base_fps
+        rule_fps = self.rules[self.tier]["fps"]
+        base = parse_fps(base_fps)
+        if base is not None and base <= rule_fps:
+            return base_fps
+        return rule_fps
+
+    def update(self, pids=(), base_fps=None):
+        """Takes a sample, returns True when the tier changed and engines should be re-applied."""
+        sample = self.last_sample = self.state.sample(pids)
+        tier = self.choose(sample, base_fps)
+        if tier == self.tier:
+            self.candidate, self.candidate_samples = None, 0
+            return False
+
+        if tier != self.candidate:
+            self.candidate, self.candidate_samples = tier, 0
+        self.candidate_samples += 1
+        if self.candidate_samples < self.dwell:
+            return False
+
+        self.tier = tier
+        self.candidate, self.candidate_samples = None, 0
+        return True
+
+    def describe(self, base_fps):
+        tier = "configured fps" if self.tier is None else f"rule {self.tier}"
+        line = f"FPS governor: {self.fps(base_fps)} fps ({tier})"
+        if self.last_sample:
+            sample = self.last_sample
+            battery = "-" if sample["battery"] is None else f"{sample['battery']}%"
+            power = "battery" if sample["on_battery"] else "AC"
+            line += f", {power} {battery}, load {sample['load']:.2f}, engine cpu {sample['engine_cpu']:.0f}%"
+        return line
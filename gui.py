@@ -0,0 +1,853 @@
+import gi
+gi.require_version('Gtk', '4.0')
+from gi.repository import Gtk, Gdk, Gio, GLib, GObject
+import os
+import time
+
+from config import (
+    IS_FLATPAK, assign_wallpaper, get_config, get_workshop_dirs, migrate_assignments, save_config,
+    screen_assignments,
+)
+import control
+from costs import COST_TIERS, CostStore, cost_tier, describe_cost
+from displays import HOTPLUG_DEBOUNCE_MS, connected_screens, monitor_connector
+from engine import EngineSupervisor, apply_wallpapers, engine_path_from_config
+from library import WALLPAPER_TYPES, LibraryIndex, matches_filter
+from preflight import PreflightCache
+from search import SearchIndex, sort_key
+from textures import DEFAULT_TEXTURE_CACHE_MB, TextureCache
+from thumbnails import DEFAULT_CACHE_SIZE_MB, ThumbnailLoader, get_thumbnail, prune_thumbnails
+from tracing import tracer
+from watcher import WorkshopWatcher
+from watchdog import WATCH_INTERVAL, CrashLog, EngineWatchdog
+from worker import BackgroundWorker
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+UI_PATH = os.path.join(SCRIPT_DIR, "main.ui")
+
+# Width of a wallpaper tile in the grid, in logical pixels
+TILE_SIZE = 60
+
+# Width of the sidebar preview, in logical pixels
+PREVIEW_SIZE = 200
+
+# How often scanned records are handed to the grid while a scan is running
+SCAN_BATCH_INTERVAL = 0.05
+
+SORT_LABELS = (
+    ("title", "Sort by Title"),
+    ("added", "Sort by Date Added"),
+    ("size", "Sort by File Size"),
+    ("type", "Sort by Type"),
+    ("cost", "Sort by Cost"),
+)
+
+COST_LABELS = {
+    "light": f"Light (under {COST_TIERS[0][1]}% CPU)",
+    "medium": f"Medium (under {COST_TIERS[1][1]}% CPU)",
+    "heavy": "Heavy",
+    "unmeasured": "Not Measured",
+}
+
+class WallpaperItem(GObject.Object):
+    """Lightweight record behind a grid tile, it only holds a texture while the tile is visible."""
+
+    def __init__(self, wallpaper_id, entry, sort_key):
+        super().__init__()
+        self.wallpaper_id = wallpaper_id
+        self.entry = entry
+        self.sort_key = sort_key
+        self.img_path = entry.get("preview_path")
+        self.picture = None
+        self.badge = None
+        self.texture = None
+        self.future = None
+
+class CliFrontend(Gtk.Application):
+    def __init__(self):
+        super().__init__(application_id="com.example.wallpaperengine")
+        self.library = LibraryIndex()
+        self.search_index = SearchIndex()
+        self.texture_cache = TextureCache(get_config().get("texture_cache_mb", DEFAULT_TEXTURE_CACHE_MB) * 1024 * 1024)
+        self.preview_wallpaper_id = None
+        self.thumbnail_loader = ThumbnailLoader()
+        self.workshop_watchers = []
+        self.supervisor = EngineSupervisor()
+        # Stopping engines can take seconds, so the supervisor is only used from
+        # this single worker, which also keeps applies and restarts in order
+        self.engine_worker = BackgroundWorker("engines")
+        self.engine_upkeep_queued = False
+        self.crash_log = CrashLog.from_config(get_config())
+        self.quarantined = self.crash_log.quarantined()
+        # The watchdog runs on the worker with its own view of the crash log
+        self.watchdog = EngineWatchdog(self.supervisor, CrashLog.from_config(get_config()))
+        self.preflight = PreflightCache.from_config(get_config())
+        # Wallpapers whose package looks like the engine will fail on it, with the reasons
+        self.preflight_issues = {}
+        # Measured by `--bench-wallpapers`, at the configured fps
+        self.cost_store = CostStore()
+        self.costs = self.cost_store.costs(get_config().get("fps"))
+        self.screens = None
+        self.hotplug_timeout_id = None
+        self.connect("activate", self.on_activate)
+
+    def on_activate(self, app):
+        # Load UI from Cambalache .ui file
+        builder = Gtk.Builder()
+        builder.add_from_file(UI_PATH)
+        self.builder = builder
+        self.window = builder.get_object("main")
+        self.window.set_application(app)
+        self.window.connect("close-request", self.on_close_request)
+        
+        # Set initial window size
+        self.window.set_default_size(800, 600)
+
+        # Set sidebar width (paned position)
+        paned = self.window.get_child()
+        if hasattr(paned, "set_position"):
+            paned.set_position(220)  # Sidebar width (preview image + padding)
+
+        config_data = get_config()
+
+        # The store keeps every scanned wallpaper, content filters only hide items
+        self.mature_content = config_data.get("MATURE_CONTENT", False)
+        self.type_filter = config_data.get("type_filter") or None
+        self.search_query = ""
+        self.tag_filter = None
+        self.tag_names = None
+        self.visible_ids = None
+        self.sort_order = config_data.get("sort_order", "title")
+        self.cost_filter = config_data.get("cost_filter") or None
+        self.wallpaper_store = Gio.ListStore(item_type=WallpaperItem)
+        self.wallpaper_filter = Gtk.CustomFilter.new(self.filter_wallpaper)
+        self.filtered_wallpapers = Gtk.FilterListModel(model=self.wallpaper_store, filter=self.wallpaper_filter)
+        self.wallpaper_sorter = Gtk.CustomSorter.new(self.compare_wallpapers, None)
+        self.sorted_wallpapers = Gtk.SortListModel(model=self.filtered_wallpapers, sorter=self.wallpaper_sorter)
+        # Spread filtering and sorting over several frames so typing never stalls the UI
+        self.filtered_wallpapers.set_incremental(True)
+        self.sorted_wallpapers.set_incremental(True)
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_tile_setup)
+        factory.connect("bind", self.on_tile_bind)
+        factory.connect("unbind", self.on_tile_unbind)
+
+        self.image_grid = self.builder.get_object("image_grid")
+        self.image_grid.set_model(Gtk.NoSelection(model=self.sorted_wallpapers))
+        self.image_grid.set_factory(factory)
+        self.image_grid.connect("activate", self.on_wallpaper_activated)
+        self.populate_images()
+
+        self.display_selector = self.builder.get_object("display_selector")
+        self.selected_image_preview = Gtk.Image()
+        sidebar_box = self.display_selector.get_parent()
+        sidebar_box.append(self.selected_image_preview)
+        self.selected_image_preview.show()
+
+        self.apply_button = Gtk.Button(label="Apply Wallpaper")
+        sidebar_box.append(self.apply_button)
+        self.apply_button.connect("clicked", self.apply_walls)
+        self.apply_button.show()
+
+        # Add "Clear" button under the kill button
+        self.clear_button = Gtk.Button(label="Clear")
+        sidebar_box.append(self.clear_button)
+        self.clear_button.connect("clicked", self.on_clear_wallpaper_clicked)
+        self.clear_button.show()
+
+        # Add "Kill Wallpapers" button under the apply button
+        self.kill_button = Gtk.Button(label="Kill")
+        sidebar_box.append(self.kill_button)
+        self.kill_button.connect("clicked", self.kill_walls)
+        self.kill_button.show()
+
+        # Add a separator with padding top and bottom
+        separator = Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL)
+        separator.set_margin_top(6)
+        separator.set_margin_bottom(6)
+        sidebar_box.append(separator)
+        separator.show()
+
+        # Add toggle button for mature content
+        self.mature_toggle = Gtk.ToggleButton(label="Mature Content")
+        self.mature_toggle.set_active(False)
+        self.mature_toggle.connect("toggled", self.toggle_mature_content)
+        sidebar_box.append(self.mature_toggle)
+        self.mature_toggle.show()
+
+        if "MATURE_CONTENT" in config_data:
+            self.mature_toggle.set_active(config_data["MATURE_CONTENT"])
+            if config_data["MATURE_CONTENT"]:
+                self.mature_toggle.set_css_classes(["suggested-action"])
+            else:
+                self.mature_toggle.set_css_classes(["destructive-action"])
+        else:
+            self.mature_toggle.set_css_classes(["destructive-action"])
+
+        # Filter by the wallpaper type from project.json
+        self.type_selector = Gtk.ComboBoxText()
+        self.type_selector.append("all", "All Types")
+        for wallpaper_type in WALLPAPER_TYPES:
+            self.type_selector.append(wallpaper_type, wallpaper_type.capitalize())
+        self.type_selector.set_active_id(self.type_filter or "all")
+        self.type_selector.connect("changed", self.on_type_filter_changed)
+        sidebar_box.append(self.type_selector)
+        self.type_selector.show()
+
+        # Search over title, tags, description, type and workshop ID
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text("Search")
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        sidebar_box.append(self.search_entry)
+        self.search_entry.show()
+
+        self.tag_selector = Gtk.ComboBoxText()
+        self.tag_selector.append("all", "All Tags")
+        self.tag_selector.set_active_id("all")
+        self.tag_changed_handler = self.tag_selector.connect("changed", self.on_tag_filter_changed)
+        sidebar_box.append(self.tag_selector)
+        self.tag_selector.show()
+        self.refresh_tag_selector()
+
+        self.cost_selector = Gtk.ComboBoxText()
+        self.cost_selector.append("all", "Any Cost")
+        for tier, label in COST_LABELS.items():
+            self.cost_selector.append(tier, label)
+        self.cost_selector.set_active_id(self.cost_filter or "all")
+        self.cost_selector.connect("changed", self.on_cost_filter_changed)
+        sidebar_box.append(self.cost_selector)
+        self.cost_selector.show()
+
+        self.sort_selector = Gtk.ComboBoxText()
+        for order, label in SORT_LABELS:
+            self.sort_selector.append(order, label)
+        self.sort_selector.set_active_id(self.sort_order)
+        self.sort_selector.connect("changed", self.on_sort_changed)
+        sidebar_box.append(self.sort_selector)
+        self.sort_selector.show()
+
+        # Add a separator with padding top and bottom
+        separator = Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL)
+        separator.set_margin_top(6)
+        separator.set_margin_bottom(6)
+        sidebar_box.append(separator)
+        separator.show()
+
+        self.settings_button = Gtk.Button(label="Settings")
+        sidebar_box.append(self.settings_button)
+        self.settings_button.connect("clicked", self.open_settings_widget)
+        self.settings_button.show()
+
+        self.populate_displays()
+        self.display_selector.connect("changed", self.on_display_changed)
+
+        # Engines started from here are restarted here when they crash
+        GLib.timeout_add_seconds(WATCH_INTERVAL, self.on_watchdog_tick)
+
+        self.window.present()
+        self.update_selected_image_preview()
+
+    def on_close_request(self, *args):
+        if self.hotplug_timeout_id is not None:
+            GLib.source_remove(self.hotplug_timeout_id)
+            self.hotplug_timeout_id = None
+        for watcher in self.workshop_watchers:
+            watcher.stop()
+        self.thumbnail_loader.shutdown()
+        self.engine_worker.shutdown()
+        prune_thumbnails(get_config().get("thumbnail_cache_mb", DEFAULT_CACHE_SIZE_MB))
+        self.quit()
+
+    def toggle_mature_content(self, button):
+        config_data = get_config()
+        config_data["MATURE_CONTENT"] = button.get_active()
+        save_config(config_data)
+
+        # Update toggle button color
+        if config_data["MATURE_CONTENT"]:
+            self.mature_toggle.set_css_classes(["suggested-action"])
+        else:
+            self.mature_toggle.set_css_classes(["destructive-action"])
+
+        # Re-filter the loaded wallpapers, nothing is rescanned or decoded again
+        self.mature_content = config_data["MATURE_CONTENT"]
+        self.wallpaper_filter.changed(Gtk.FilterChange.DIFFERENT)
+
+    def on_type_filter_changed(self, combo):
+        type_id = combo.get_active_id()
+        self.type_filter = None if type_id in (None, "all") else type_id
+
+        config_data = get_config()
+        config_data["type_filter"] = self.type_filter
+        save_config(config_data)
+        self.wallpaper_filter.changed(Gtk.FilterChange.DIFFERENT)
+
+    def on_cost_filter_changed(self, combo):
+        tier = combo.get_active_id()
+        self.cost_filter = None if tier in (None, "all") else tier
+
+        config_data = get_config()
+        config_data["cost_filter"] = self.cost_filter
+        save_config(config_data)
+        self.wallpaper_filter.changed(Gtk.FilterChange.DIFFERENT)
+
+    def refresh_costs(self):
+        self.costs = self.cost_store.costs(get_config().get("fps"))
+        if self.sort_order == "cost":
+            self.resort()
+        if self.cost_filter:
+            self.wallpaper_filter.changed(Gtk.FilterChange.DIFFERENT)
+        self.refresh_tile_flags()
+
+    def on_search_changed(self, entry):
+        query = entry.get_text()
+        old_query, self.search_query = self.search_query, query
+
+        # Typing on only narrows the results, deleting only widens them
+        if query.startswith(old_query):
+            change = Gtk.FilterChange.MORE_STRICT
+        elif old_query.startswith(query):
+            change = Gtk.FilterChange.LESS_STRICT
+        else:
+            change = Gtk.FilterChange.DIFFERENT
+        self.update_search(change)
+
+    def on_tag_filter_changed(self, combo):
+        tag = combo.get_active_id()
+        self.tag_filter = None if tag in (None, "all") else tag
+        self.update_search(Gtk.FilterChange.DIFFERENT)
+
+    def update_search(self, change):
+        self.visible_ids = self.search_index.search(self.search_query, self.tag_filter)
+        self.wallpaper_filter.changed(change)
+
+    def refresh_tag_selector(self):
+        tag_names = self.search_index.tag_names()
+        if tag_names == self.tag_names:
+            return
+        self.tag_names = tag_names
+
+        with self.tag_selector.handler_block(self.tag_changed_handler):
+            self.tag_selector.remove_all()
+            self.tag_selector.append("all", "All Tags")
+            for tag in tag_names:
+                self.tag_selector.append(tag, tag)
+            found = self.tag_selector.set_active_id(self.tag_filter or "all")
+        if not found:
+            self.tag_selector.set_active_id("all")
+
+    def on_sort_changed(self, combo):
+        self.sort_order = combo.get_active_id() or "title"
+        config_data = get_config()
+        config_data["sort_order"] = self.sort_order
+        save_config(config_data)
+        self.resort()
+
+    def resort(self):
+        for position in range(self.wallpaper_store.get_n_items()):
+            item = self.wallpaper_store.get_item(position)
+            item.sort_key = self.item_sort_key(item.wallpaper_id, item.entry)
+        self.wallpaper_sorter.changed(Gtk.SorterChange.DIFFERENT)
+
+    def item_sort_key(self, wallpaper_id, entry):
+        return sort_key(wallpaper_id, entry, self.sort_order, self.costs.get(wallpaper_id))
+
+    def compare_wallpapers(self, a, b, *args):
+        if a.sort_key < b.sort_key:
+            return Gtk.Ordering.SMALLER
+        if a.sort_key > b.sort_key:
+            return Gtk.Ordering.LARGER
+        return Gtk.Ordering.EQUAL
+
+    def filter_wallpaper(self, item):
+        if self.visible_ids is not None and item.wallpaper_id not in self.visible_ids:
+            return False
+        if self.cost_filter and (cost_tier(self.costs.get(item.wallpaper_id)) or "unmeasured") != self.cost_filter:
+            return False
+        return matches_filter(
+            item.entry,
+            self.mature_content,
+            (self.type_filter,) if self.type_filter else None,
+        )
+
+    def populate_images(self):
+        # Starting a new job cancels any scan or decode still running for the old grid
+        job = self.thumbnail_loader.start_job()
+        self.wallpaper_store.remove_all()
+        self.search_index.clear()
+        for watcher in self.workshop_watchers:
+            watcher.stop()
+        self.workshop_watchers = []
+
+        # The configured path plus every Steam library folder
+        workshop_dirs = get_workshop_dirs()
+        if not workshop_dirs:
+            return
+
+        # After the initial scan only folders reported by the watchers are looked at again
+        for workshop_dir in workshop_dirs:
+            watcher = WorkshopWatcher(workshop_dir, self.on_workshop_changed)
+            watcher.start()
+            self.workshop_watchers.append(watcher)
+
+        def scan():
+            # Stream records to the grid while the scan is still running
+            batch = []
+            deadline = time.monotonic() + SCAN_BATCH_INTERVAL
+            for wallpaper_id, entry in self.library.scan(workshop_dirs):
+                if job.cancelled.is_set():
+                    return
+                batch.append((wallpaper_id, entry))
+                if time.monotonic() >= deadline:
+                    self.thumbnail_loader.post(job, self.on_scan_batch, batch)
+                    batch = []
+                    deadline = time.monotonic() + SCAN_BATCH_INTERVAL
+            self.thumbnail_loader.post(job, self.on_scan_batch, batch)
+
+            # Package headers are only read once the grid is filled
+            entries = dict(self.library.entries)
+            flagged = self.preflight.inspect_all(entries, job.cancelled)
+            self.thumbnail_loader.post(job, lambda flagged: self.on_preflight_done(flagged, entries), flagged)
+
+        self.thumbnail_loader.submit(job, None, scan)
+
+    def on_scan_batch(self, entries):
+        # A wallpaper found again in a folder that takes priority replaces the one shown
+        entries = dict(entries)
+        self.remove_items({wallpaper_id for wallpaper_id in entries if wallpaper_id in self.search_index})
+
+        items = []
+        for wallpaper_id, entry in entries.items():
+            if not entry.get("preview_path"):
+                continue
+            # Every scanned record is tokenized once, searching only looks at the index
+            self.search_index.add(wallpaper_id, entry)
+            items.append(WallpaperItem(wallpaper_id, entry, self.item_sort_key(wallpaper_id, entry)))
+
+        # The sidebar preview may have been waiting for this wallpaper's record
+        if self.preview_wallpaper_id in entries:
+            self.update_selected_image_preview()
+
+        # New records have to be matched before they reach the filter
+        if self.visible_ids is not None:
+            self.visible_ids = self.search_index.search(self.search_query, self.tag_filter)
+        self.refresh_tag_selector()
+
+        # Only records go into the model, the grid view creates widgets for visible tiles
+        with tracer.span("add grid records"):
+            self.wallpaper_store.splice(self.wallpaper_store.get_n_items(), 0, items)
+
+    def on_preflight_done(self, flagged, inspected):
+        for wallpaper_id in inspected:
+            self.preflight_issues.pop(wallpaper_id, None)
+        self.preflight_issues.update(flagged)
+        self.refresh_tile_flags()
+
+    def on_workshop_changed(self, item_dirs):
+        self.thumbnail_loader.submit(
+            self.thumbnail_loader.job,
+            self.on_library_updated,
+            self.library.update_items, item_dirs,
+        )
+
+    def on_library_updated(self, result):
+        if result is None:
+            return
+        updated, removed = result
+        stale = set(updated) | set(removed)
+
+        # Drop the old records of changed and removed wallpapers, then append the new ones
+        self.remove_items(stale)
+        self.texture_cache.invalidate(stale)
+        self.on_scan_batch(list(updated.items()))
+        print(f"Workshop changed: {len(updated)} updated, {len(removed)} removed")
+
+        self.thumbnail_loader.submit(
+            self.thumbnail_loader.job,
+            lambda flagged: self.on_preflight_done(flagged, stale),
+            self.preflight.inspect_all, updated,
+        )
+
+    def remove_items(self, wallpaper_ids):
+        if not wallpaper_ids:
+            return
+        for position in reversed(range(self.wallpaper_store.get_n_items())):
+            if self.wallpaper_store.get_item(position).wallpaper_id in wallpaper_ids:
+                self.wallpaper_store.remove(position)
+        for wallpaper_id in wallpaper_ids:
+            self.search_index.remove(wallpaper_id)
+
+    def on_watchdog_tick(self):
+        # A tick is skipped while an apply or kill still holds the worker
+        if not self.engine_upkeep_queued:
+            self.engine_upkeep_queued = True
+            self.engine_worker.submit(self.on_engine_upkeep_done, self.engine_upkeep)
+        # The watchdog or the daemon may have quarantined something
+        quarantined = self.crash_log.quarantined()
+        if quarantined.keys() != self.quarantined.keys():
+            self.quarantined = quarantined
+            self.refresh_tile_flags()
+        # So is a benchmark
+        if self.cost_store.load():
+            self.refresh_costs()
+        return GLib.SOURCE_CONTINUE
+
+    def engine_upkeep(self):
+        """Restarts crashed engines and rotates their logs, returns the newly quarantined IDs."""
+        try:
+            newly_quarantined = []
+            if get_config().get("watchdog", True):
+                newly_quarantined = self.watchdog.poll()
+            # Engines started from here have their logs rotated here
+            if self.supervisor.children:
+                self.supervisor.rotate_logs()
+            return newly_quarantined
+        finally:
+            self.engine_upkeep_queued = False
+
+    def on_engine_upkeep_done(self, newly_quarantined):
+        # Dim the tiles right away instead of on the next tick
+        if newly_quarantined:
+            self.quarantined = self.crash_log.quarantined()
+            self.refresh_tile_flags()
+
+    def refresh_tile_flags(self):
+        # Only tiles on screen have widgets to update, the others are flagged when bound
+        for position in range(self.wallpaper_store.get_n_items()):
+            item = self.wallpaper_store.get_item(position)
+            if item.picture is not None:
+                self.flag_tile(item)
+
+    def flag_tile(self, item):
+        """
+        Dims the tiles of quarantined wallpapers, badges the ones preflight
+        warned about and puts the reasons and the measured cost in the tooltip.
+        """
+        info = self.quarantined.get(item.wallpaper_id)
+        issues = self.preflight_issues.get(item.wallpaper_id)
+        tooltip = []
+        if info:
+            tooltip.append(f"Crashed the engine {info['crashes']} times, pick it again to retry")
+        if issues:
+            tooltip += issues
+        cost = self.costs.get(item.wallpaper_id)
+        if cost:
+            tooltip.append(describe_cost(cost))
+        item.picture.set_opacity(0.35 if info else 1.0)
+        item.badge.set_visible(bool(issues))
+        item.picture.get_parent().set_tooltip_text("\n".join(tooltip) or None)
+
+    def on_tile_setup(self, factory, list_item):
+        tracer.count("tile widgets created")
+        picture = Gtk.Picture()
+        picture.set_content_fit(Gtk.ContentFit.CONTAIN)
+        picture.set_size_request(TILE_SIZE, TILE_SIZE)
+        badge = Gtk.Image.new_from_icon_name("dialog-warning-symbolic")
+        badge.set_halign(Gtk.Align.END)
+        badge.set_valign(Gtk.Align.START)
+        badge.set_visible(False)
+        overlay = Gtk.Overlay()
+        overlay.set_child(picture)
+        overlay.add_overlay(badge)
+        list_item.set_child(overlay)
+
+    def on_tile_bind(self, factory, list_item):
+        item = list_item.get_item()
+        overlay = list_item.get_child()
+        item.picture = overlay.get_child()
+        item.badge = overlay.get_last_child()
+        self.flag_tile(item)
+
+        scale = self.scale_factor()
+        key = (item.wallpaper_id, TILE_SIZE, scale)
+        item.texture = self.texture_cache.get(key)
+        item.picture.set_paintable(item.texture)
+        if item.texture is not None:
+            return
+
+        item.future = self.thumbnail_loader.submit(
+            self.thumbnail_loader.job,
+            lambda pixbuf: self.on_thumbnail_loaded(item, key, pixbuf),
+            get_thumbnail, item.img_path, TILE_SIZE * scale,
+        )
+
+    def on_tile_unbind(self, factory, list_item):
+        item = list_item.get_item()
+        if item.future:
+            item.future.cancel()
+            item.future = None
+
+        # The cache keeps the texture, the tile only lets go of it
+        item.picture = None
+        item.badge = None
+        item.texture = None
+        overlay = list_item.get_child()
+        overlay.get_child().set_paintable(None)
+        overlay.get_child().set_opacity(1.0)
+        overlay.get_last_child().set_visible(False)
+        overlay.set_tooltip_text(None)
+
+    def on_thumbnail_loaded(self, item, key, pixbuf):
+        item.future = None
+        if pixbuf is None:
+            return
+        # Cached even if the tile scrolled away meanwhile, it is likely to come back
+        texture = self.texture_cache.add(key, pixbuf)
+        if item.picture is None:
+            return
+        item.texture = texture
+        item.picture.set_paintable(texture)
+
+    def scale_factor(self):
+        # Get UI scale (fallback to 1 if not set)
+        return self.window.get_scale_factor() if hasattr(self.window, "get_scale_factor") else 1
+    
+    def get_image_parent_folder(self, img_path):
+        return os.path.basename(os.path.dirname(img_path))
+
+    def populate_displays(self):
+        display = Gdk.Display.get_default()
+        if display:
+            # GTK4: Use get_monitors() which returns a GListModel
+            display.get_monitors().connect("items-changed", self.on_monitors_changed)
+        self.refresh_displays()
+
+    def refresh_displays(self):
+        """Lists the current monitors in the selector, keyed by connector name."""
+        active = self.display_selector.get_active_id()
+        self.screens = self.get_screens()
+        self.display_selector.remove_all()
+        for i, screen_id in enumerate(self.screens or []):
+            self.display_selector.append(screen_id, f"Screen {i} ({screen_id})")
+        if not active or not self.display_selector.set_active_id(active):
+            self.display_selector.set_active(0)
+
+        if self.screens is None:
+            return
+        # Old "0", "1", ... assignments follow the monitor order saved last time, move them
+        # to connector names before that order is replaced. The headless `--set 0` still uses it
+        config_data = get_config()
+        changed = migrate_assignments(config_data, self.screens)
+        if config_data.get("screens") != self.screens:
+            config_data["screens"] = self.screens
+            changed = True
+        if changed:
+            save_config(config_data)
+
+    def on_monitors_changed(self, monitors, position, removed, added):
+        # Wait until the burst of events from a dock or a waking monitor is over
+        if self.hotplug_timeout_id is not None:
+            GLib.source_remove(self.hotplug_timeout_id)
+        self.hotplug_timeout_id = GLib.timeout_add(HOTPLUG_DEBOUNCE_MS, self.on_monitors_settled)
+
+    def on_monitors_settled(self):
+        self.hotplug_timeout_id = None
+        before = connected_screens(self.screens)
+        self.refresh_displays()
+        after = connected_screens(self.screens)
+        if after == before:
+            return GLib.SOURCE_REMOVE
+
+        print(f"Screens changed: {' '.join(sorted(after - before)) or '-'} connected, "
+              f"{' '.join(sorted(before - after)) or '-'} disconnected")
+        self.update_selected_image_preview()
+        self.engine_worker.submit(None, self.reapply_wallpapers, self.screens)
+        return GLib.SOURCE_REMOVE
+
+    def reapply_wallpapers(self, screens):
+        # A daemon notices the change itself, and engines the user stopped stay stopped
+        if not control.daemon_listening() and self.supervisor.tracked():
+            apply_wallpapers(self.supervisor, get_config(), screens)
+
+    def on_wallpaper_activated(self, grid_view, position):
+        parent_folder = grid_view.get_model().get_item(position).wallpaper_id
+        print(f"Selected wallpaper: {parent_folder}")
+
+        # Get selected screen id
+        screen_id = self.display_selector.get_active_id()
+        if screen_id is None:
+            print("No screen selected.")
+            return
+
+        # Load configuration from config.json
+        config_data = get_config()
+
+        # Update the mapping for the selected screen
+        assign_wallpaper(config_data, screen_id, parent_folder, self.screens)
+        save_config(config_data)  # Save the updated configuration
+
+        # Picking a quarantined wallpaper again means trying it again
+        if self.crash_log.release(parent_folder):
+            print(f"Released {parent_folder} from quarantine")
+            self.quarantined = self.crash_log.quarantined()
+            self.refresh_tile_flags()
+
+        print(f"Updated config.json: Screen {screen_id} -> {parent_folder}")
+
+        # Update the preview for the selected screen
+        self.update_selected_image_preview()
+
+    def on_display_changed(self, combo):
+        self.update_selected_image_preview()
+
+    def update_selected_image_preview(self):
+        screen_id = self.display_selector.get_active_id()
+        if screen_id is None:
+            self.preview_wallpaper_id = None
+            self.selected_image_preview.clear()
+            return
+
+        # Load configuration from config.json
+        config_data = get_config()
+        self.preview_wallpaper_id = screen_assignments(config_data, self.screens).get(screen_id)
+
+        # The library already knows where the preview is, nothing is read from the workshop here
+        entry = self.library.entries.get(self.preview_wallpaper_id) if self.preview_wallpaper_id else None
+        if not entry or not entry.get("preview_path"):
+            self.selected_image_preview.clear()
+            return
+
+        scale = self.scale_factor()
+        key = (self.preview_wallpaper_id, PREVIEW_SIZE, scale)
+        texture = self.texture_cache.get(key)
+        if texture is not None:
+            self.show_selected_preview(texture, scale)
+            return
+
+        self.selected_image_preview.clear()
+        wallpaper_id = self.preview_wallpaper_id
+        self.thumbnail_loader.submit(
+            self.thumbnail_loader.job,
+            lambda pixbuf: self.on_selected_preview_loaded(wallpaper_id, key, pixbuf),
+            get_thumbnail, entry["preview_path"], PREVIEW_SIZE * scale,
+        )
+
+    def on_selected_preview_loaded(self, wallpaper_id, key, pixbuf):
+        if pixbuf is None:
+            return
+        texture = self.texture_cache.add(key, pixbuf)
+        # Another screen or wallpaper may have been picked while this one was decoding
+        if wallpaper_id == self.preview_wallpaper_id:
+            self.show_selected_preview(texture, key[2])
+
+    def show_selected_preview(self, texture, scale):
+        self.selected_image_preview.set_from_paintable(texture)
+        self.selected_image_preview.set_size_request(PREVIEW_SIZE, texture.get_height() // scale)
+
+    def get_screens(self):
+        """Connector names of the current monitors, None without a display."""
+        display = Gdk.Display.get_default()
+        if not display:
+            return None
+
+        monitors = display.get_monitors()
+        return [monitor_connector(monitors.get_item(i), i) for i in range(monitors.get_n_items())]
+
+    def apply_walls(self, button, dry_run=False):
+        self.engine_worker.submit(None, self.apply_in_background, self.get_screens(), dry_run)
+
+    def apply_in_background(self, screens, dry_run):
+        # A running daemon owns the engines, let it do the work
+        result = control.request("apply", ["--dry-run"] if dry_run else [])
+        if result is not None:
+            print(result[1], end="")
+            return
+        apply_wallpapers(self.supervisor, get_config(), screens, dry_run)
+
+    def kill_walls(self, button):
+        self.engine_worker.submit(None, self.kill_in_background)
+
+    def kill_in_background(self):
+        result = control.request("kill")
+        if result is not None:
+            print(result[1], end="")
+            return
+        config_data = get_config()
+        stopped = self.supervisor.stop_all(engine_path_from_config(config_data))
+        print(f"Stopped {len(stopped)} wallpaper engine processes.")
+
+    def on_clear_wallpaper_clicked(self, button):
+        screen_id = self.display_selector.get_active_id()
+        if screen_id is None:
+            return
+        config_data = get_config()
+        if screen_id in screen_assignments(config_data, self.screens):
+            assign_wallpaper(config_data, screen_id, None, self.screens)
+            save_config(config_data)
+        self.update_selected_image_preview()
+
+    def open_settings_widget(self, button):
+        settings_window = Gtk.Window(title="Settings")
+        settings_window.set_default_size(400, 300)
+        settings_window.set_transient_for(self.window)
+        settings_window.set_modal(True)
+
+        grid = Gtk.Grid()
+        grid.set_row_spacing(10)
+        grid.set_column_spacing(10)
+        grid.set_margin_top(10)
+        grid.set_margin_bottom(10)
+        grid.set_margin_start(10)
+        grid.set_margin_end(10)
+        settings_window.set_child(grid)
+
+        config_data = get_config()
+
+        if not IS_FLATPAK:
+            engine_label = Gtk.Label(label="Engine Path:")
+            grid.attach(engine_label, 0, 0, 1, 1)
+            engine_entry = Gtk.Entry()
+            engine_entry.set_hexpand(True)
+            engine_entry.set_text(config_data.get("engine_path", ""))
+            grid.attach(engine_entry, 1, 0, 1, 1)
+
+        fps_label = Gtk.Label(label="FPS:")
+        grid.attach(fps_label, 0, 1, 1, 1)
+        fps_entry = Gtk.Entry()
+        fps_entry.set_hexpand(True)
+        fps_entry.set_text(str(config_data.get("fps", "")))
+        grid.attach(fps_entry, 1, 1, 1, 1)
+
+        path_label = Gtk.Label(label="Workshop Path:")
+        grid.attach(path_label, 0, 2, 1, 1)
+        path_entry = Gtk.Entry()
+        path_entry.set_hexpand(True)
+        # Several workshop folders are separated like in $PATH
+        path = config_data.get("path", "")
+        path_entry.set_text(os.pathsep.join(path) if isinstance(path, list) else path)
+        grid.attach(path_entry, 1, 2, 1, 1)
+
+        fill_lable = Gtk.Label(label="Fill: ")
+        grid.attach(fill_lable, 0, 3, 1, 1)
+        fill_entry = Gtk.CheckButton()
+        fill_entry.set_active(config_data.get("fill", False))
+        grid.attach(fill_entry, 1, 3, 1, 1)
+
+        per_screen_label = Gtk.Label(label="One engine per screen: ")
+        grid.attach(per_screen_label, 0, 4, 1, 1)
+        per_screen_entry = Gtk.CheckButton()
+        per_screen_entry.set_active(config_data.get("apply_mode") == "per-screen")
+        grid.attach(per_screen_entry, 1, 4, 1, 1)
+
+        save_button = Gtk.Button(label="Save")
+        grid.attach(save_button, 0, 5, 2, 1)
+        
+        def save_settings(btn):
+            settings = {
+                **get_config(),
+                "engine_path": engine_entry.get_text(),
+                "fps": int(fps_entry.get_text()) if fps_entry.get_text().isdigit() else None,
+                "fill": bool(fill_entry.get_active()),
+                "apply_mode": "per-screen" if per_screen_entry.get_active() else "combined"
+            }
+            if not IS_FLATPAK:
+                paths = [path for path in path_entry.get_text().split(os.pathsep) if path]
+                settings["path"] = paths if len(paths) > 1 else path_entry.get_text()
+            path_changed = settings.get("path") != config_data.get("path")
+            save_config(settings)
+            print("Settings saved.")
+            settings_window.close()
+            if path_changed:
+                self.populate_images()
+        save_button.connect("clicked", save_settings)
+        settings_window.present()
@@ -155,7 +155,7 @@ cat > ~/.config/wallpaperengine-linux/config.json << EOF
 }
 EOF
 
-cp main.py ~/.local/share/wallpaperengine-linux/
+cp *.py ~/.local/share/wallpaperengine-linux/
 cp icon.png ~/.local/share/wallpaperengine-linux/
 cp main.ui ~/.local/share/wallpaperengine-linux/
 cp main.ui.cmb ~/.local/share/wallpaperengine-linux/
@@ -0,0 +1,359 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import queue
+import threading
+
+from config import CACHE_DIR, JsonFile
+from tracing import tracer
+
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+INDEX_VERSION = 3
+
+# project.json fields kept in the index
+INDEXED_FIELDS = ("preview", "contentrating", "title", "type", "file", "tags", "description")
+
+MATURE_RATINGS = ("Mature", "Questionable")
+
+# Workshop items are often network mounted, per-item work is I/O bound
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# How deep below an item's folder a missing preview is searched for
+PREVIEW_SEARCH_DEPTH = 2
+
+def list_item_dirs(workshop_dir):
+    """Returns the <workshop>/<id>/ folders, project.json never lives deeper than that."""
+    try:
+        with os.scandir(workshop_dir) as it:
+            return [entry.path for entry in it if entry.is_dir()]
+    except OSError as e:
+        print(f"Failed to list {workshop_dir}: {e}")
+        return []
+
+def find_file(directory, name, max_depth=PREVIEW_SEARCH_DEPTH):
+    """Breadth-first search for name, never descending more than max_depth levels."""
+    level = [directory]
+    for depth in range(max_depth + 1):
+        next_level = []
+        for path in level:
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.name == name and entry.is_file():
+                            return entry.path
+                        if depth < max_depth and entry.is_dir(follow_symlinks=False):
+                            next_level.append(entry.path)
+            except OSError:
+                continue
+        level = next_level
+    return None
+
+def resolve_preview(subdir, preview_name):
+    # Try all possible locations for the preview image
+    img_path = os.path.join(subdir, preview_name)
+    if os.path.isfile(img_path):
+        return img_path
+    if os.path.isabs(preview_name) and os.path.isfile(preview_name):
+        return preview_name
+    return find_file(subdir, os.path.basename(preview_name))
+
+def read_project(project_json_path):
+    with tracer.span("parse project.json"):
+        with open(project_json_path, "r", encoding="utf-8") as f:
+            project_data = json.load(f)
+    tracer.count("project.json parsed")
+
+    entry = {field: project_data.get(field) for field in INDEXED_FIELDS}
+    entry["preview_path"] = None
+    if entry["preview"]:
+        with tracer.span("resolve preview"):
+            entry["preview_path"] = resolve_preview(os.path.dirname(project_json_path), entry["preview"])
+    return entry
+
+def item_size(subdir):
+    """Bytes in the files directly inside an item folder, where the .pkg or video lives."""
+    total = 0
+    try:
+        with os.scandir(subdir) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        pass
+    return total
+
+def is_mature(entry):
+    return entry.get("contentrating", False) in MATURE_RATINGS
+
+# Values of the project.json "type" field the grid can filter on
+WALLPAPER_TYPES = ("scene", "video", "web")
+
+def wallpaper_type(entry):
+    return (entry.get("type") or "").lower()
+
+def matches_filter(entry, mature_content=False, types=None):
+    """True if entry should be shown for the given mature setting and set of types (None means all)."""
+    if is_mature(entry) and not mature_content:
+        return False
+    if types is not None and wallpaper_type(entry) not in types:
+        return False
+    return True
+
+def dir_mtime(subdir):
+    try:
+        return os.stat(subdir).st_mtime_ns
+    except OSError:
+        return None
+
+def is_current(entry, subdir, st):
+    if entry.get("dir") != subdir or entry.get("mtime") != st.st_mtime_ns or entry.get("size") != st.st_size:
+        return False
+    if entry.get("preview_path") or not entry.get("preview"):
+        return True
+    # A preview that could not be found is only looked for again once the folder changed
+    return entry.get("dir_mtime") is not None and entry["dir_mtime"] == dir_mtime(subdir)
+
+def scan_item(subdir, old=None):
+    """
+    Returns (wallpaper_id, entry, status) for one workshop folder, status is
+    "unchanged" when old still matches project.json, otherwise the file is
+    parsed again. Returns None for folders without a readable project.json.
+    """
+    wallpaper_id = os.path.basename(subdir)
+    project_json_path = os.path.join(subdir, "project.json")
+    tracer.count("items scanned")
+    try:
+        st = os.stat(project_json_path)
+    except OSError:
+        return None
+
+    if old and is_current(old, subdir, st):
+        return wallpaper_id, old, "unchanged"
+
+    try:
+        entry = read_project(project_json_path)
+    except Exception:
+        return None
+    entry.update({
+        "dir": subdir,
+        "mtime": st.st_mtime_ns,
+        "size": st.st_size,
+        "dir_mtime": dir_mtime(subdir),
+        "file_size": item_size(subdir),
+    })
+
+    # The folder mtime is the best guess of when the item was downloaded, keep it through updates
+    entry["added"] = old.get("added") if old else None
+    if entry["added"] is None:
+        try:
+            entry["added"] = os.stat(subdir).st_mtime
+        except OSError:
+            entry["added"] = 0
+    return wallpaper_id, entry, "changed" if old else "added"
+
+def scan_workshops(workshop_dirs, known=None, max_workers=SCAN_WORKERS):
+    """
+    Yields (priority, (wallpaper_id, entry, status)) for every item in
+    workshop_dirs as soon as it is ready, priority being the index of the
+    folder it came from. known maps item folders to previous entries that
+    are reused while still current.
+
+    Every folder gets its own worker pool, so a slow disk or network share
+    never holds up the items of a fast one.
+    """
+    known = known or {}
+    results = queue.Queue()
+    executors = [
+        ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"scanner{priority}")
+        for priority in range(len(workshop_dirs))
+    ]
+
+    def scan_one(priority, subdir):
+        try:
+            results.put(("item", priority, scan_item(subdir, known.get(subdir))))
+        except Exception:
+            results.put(("item", priority, None))
+
+    def list_root(priority, workshop_dir):
+        subdirs = list_item_dirs(workshop_dir)
+        results.put(("listed", priority, len(subdirs)))
+        for subdir in subdirs:
+            try:
+                executors[priority].submit(scan_one, priority, subdir)
+            except RuntimeError:
+                # The scan was abandoned and the pool shut down
+                return
+
+    try:
+        for priority, workshop_dir in enumerate(workshop_dirs):
+            executors[priority].submit(list_root, priority, workshop_dir)
+
+        unlisted, outstanding = len(workshop_dirs), 0
+        while unlisted or outstanding:
+            kind, priority, value = results.get()
+            if kind == "listed":
+                unlisted -= 1
+                outstanding += value
+            else:
+                outstanding -= 1
+                if value is not None:
+                    yield priority, value
+    finally:
+        # Also reached when the consumer stops early, drop the work still queued
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+class LibraryIndex:
+    """
+    On-disk index of the parsed project.json files, keyed by workshop ID.
+
+    Every entry remembers the mtime and size of its project.json so a rescan
+    only re-parses wallpapers that were added or changed since the last run.
+    When an ID exists in several workshop folders the one from the earliest
+    folder wins, the others are kept in shadowed (keyed by item folder) so
+    they are not parsed again either.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.file = JsonFile(path, "wallpaper index")
+        self.entries = {}
+        self.shadowed = {}
+        self.workshop_dirs = []
+        self.dirty = False
+        self.last_changes = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.entries = {}
+        self.shadowed = {}
+        data = self.file.read()
+        if data.get("version") == INDEX_VERSION:
+            self.entries = data.get("entries", {})
+            self.shadowed = data.get("shadowed", {})
+
+    def save(self):
+        if self.file.write({"version": INDEX_VERSION, "entries": self.entries, "shadowed": self.shadowed}):
+            self.dirty = False
+
+    def clear(self):
+        self.entries = {}
+        self.shadowed = {}
+        self.dirty = True
+
+    def priority(self, subdir):
+        """Index of the workshop folder subdir belongs to, lower wins."""
+        parent = os.path.dirname(subdir)
+        for priority, workshop_dir in enumerate(self.workshop_dirs):
+            if os.path.abspath(workshop_dir) == os.path.abspath(parent):
+                return priority
+        return len(self.workshop_dirs)
+
+    def scan(self, workshop_dirs):
+        """
+        Yields (wallpaper_id, entry) for every wallpaper in workshop_dirs (a
+        folder or a list of them) while bringing the index in line with them.
+        An ID is yielded again if a copy from an earlier folder turns up
+        later, the last one yielded wins. The index is only replaced and
+        saved once the scan ran to completion.
+        """
+        if isinstance(workshop_dirs, str):
+            workshop_dirs = [workshop_dirs]
+        with self.lock, tracer.span("scan", workshop_dirs=workshop_dirs):
+            self.last_changes = None
+            self.workshop_dirs = list(workshop_dirs)
+            known = dict(self.shadowed)
+            known.update((entry.get("dir"), entry) for entry in self.entries.values())
+
+            best, shadowed = {}, {}
+            for priority, (wallpaper_id, entry, status) in scan_workshops(self.workshop_dirs, known):
+                current = best.get(wallpaper_id)
+                if current is not None and current[0] <= priority:
+                    shadowed[entry["dir"]] = entry
+                    continue
+                if current is not None:
+                    shadowed[current[1]["dir"]] = current[1]
+                best[wallpaper_id] = (priority, entry)
+                yield wallpaper_id, entry
+
+            entries = {wallpaper_id: entry for wallpaper_id, (priority, entry) in best.items()}
+            # Entries that were still current come back as the very same objects
+            added = [wallpaper_id for wallpaper_id in entries if wallpaper_id not in self.entries]
+            changed = [
+                wallpaper_id for wallpaper_id, entry in entries.items()
+                if wallpaper_id in self.entries and entry is not self.entries[wallpaper_id]
+            ]
+            removed = [wallpaper_id for wallpaper_id in self.entries if wallpaper_id not in entries]
+            if added or changed or removed or shadowed.keys() != self.shadowed.keys() or any(
+                entry is not self.shadowed[subdir] for subdir, entry in shadowed.items()
+            ):
+                self.dirty = True
+            self.entries = entries
+            self.shadowed = shadowed
+
+            if self.dirty:
+                self.save()
+            self.last_changes = (added, changed, removed)
+
+    def update_items(self, item_dirs):
+        """
+        Re-checks only the given <workshop>/<id>/ folders, for change
+        notifications. Returns (updated, removed) where updated maps IDs of
+        added or changed wallpapers to their new entries.
+        """
+        with self.lock:
+            updated, removed = {}, []
+            for subdir in item_dirs:
+                wallpaper_id = os.path.basename(subdir)
+                current = self.entries.get(wallpaper_id)
+                is_current_dir = current is not None and current.get("dir") == subdir
+                result = scan_item(subdir, current if is_current_dir else self.shadowed.get(subdir))
+
+                if result is None:
+                    self.shadowed.pop(subdir, None)
+                    # Only forget the item if the index points at this folder
+                    if is_current_dir:
+                        del self.entries[wallpaper_id]
+                        replacement = self.best_shadowed(wallpaper_id)
+                        if replacement is not None:
+                            self.entries[wallpaper_id] = self.shadowed.pop(replacement["dir"])
+                            updated[wallpaper_id] = replacement
+                        else:
+                            removed.append(wallpaper_id)
+                    continue
+
+                wallpaper_id, entry, status = result
+                if current is not None and not is_current_dir:
+                    if self.priority(current["dir"]) <= self.priority(subdir):
+                        # An earlier folder already provides this ID
+                        if status != "unchanged":
+                            self.shadowed[subdir] = entry
+                            self.dirty = True
+                        continue
+                    # This folder comes first, the copy that was shown steps back
+                    self.shadowed[current["dir"]] = current
+                elif is_current_dir and status == "unchanged":
+                    continue
+                self.shadowed.pop(subdir, None)
+                self.entries[wallpaper_id] = entry
+                updated[wallpaper_id] = entry
+
+            if updated or removed:
+                self.dirty = True
+            if self.dirty:
+                self.save()
+            return updated, removed
+
+    def best_shadowed(self, wallpaper_id):
+        copies = [entry for subdir, entry in self.shadowed.items() if os.path.basename(subdir) == wallpaper_id]
+        return min(copies, key=lambda entry: (self.priority(entry["dir"]), entry["dir"]), default=None)
+
+    def rescan(self, workshop_dirs):
+        """Bring the index in line with workshop_dirs, returns (added, changed, removed) IDs."""
+        for _ in self.scan(workshop_dirs):
+            pass
+        return self.last_changes
+
+    def rebuild(self, workshop_dirs):
+        self.clear()
+        return self.rescan(workshop_dirs)
@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+import threading
+
+from config import CACHE_DIR, JsonFile
+from tracing import tracer
+
+PREFLIGHT_PATH = os.path.join(CACHE_DIR, "preflight.json")
+PREFLIGHT_VERSION = 1
+
+# Items bigger than this are flagged, config.json "preflight_max_mb"
+DEFAULT_PREFLIGHT_MAX_MB = 512
+
+# Wallpaper types linux-wallpaperengine can draw
+SUPPORTED_TYPES = ("scene", "video", "web")
+
+# Sanity limits for the file table, anything past them is a broken or foreign file
+MAX_VERSION_LENGTH = 32
+MAX_NAME_LENGTH = 4096
+MAX_PKG_ENTRIES = 1 << 20
+
+# Files a scene is started from, reported when the package has them
+KEY_FILES = ("scene.json", "gifscene.json", "project.json")
+
+# What the file table says about the assets, counted by extension
+ASSET_KINDS = {
+    "textures": (".tex",),
+    "shaders": (".frag", ".vert", ".h"),
+    "audio": (".mp3", ".ogg", ".wav"),
+    "videos": (".mp4", ".webm"),
+}
+
+class PkgError(ValueError):
+    pass
+
+def parse_pkg(buf):
+    """
+    Parses the header and file table of a scene.pkg held in buf:
+
+        u32 length, "PKGV0001"           version
+        u32 count                        entries in the file table
+        count times:
+            u32 length, name             path inside the package
+            u32 offset, u32 size         relative to the end of the table
+
+    Returns (version, {name: (offset, size)}, offset of the data).
+    """
+    size = len(buf)
+    pos = 0
+
+    def u32():
+        nonlocal pos
+        if pos + 4 > size:
+            raise PkgError("truncated file table")
+        value = struct.unpack_from("<I", buf, pos)[0]
+        pos += 4
+        return value
+
+    def string(max_length):
+        nonlocal pos
+        length = u32()
+        if length > max_length or pos + length > size:
+            raise PkgError("corrupt file table")
+        value = bytes(buf[pos:pos + length]).decode("utf-8", errors="replace")
+        pos += length
+        return value
+
+    version = string(MAX_VERSION_LENGTH)
+    if not version.startswith("PKGV"):
+        raise PkgError("not a scene.pkg")
+    count = u32()
+    if count > MAX_PKG_ENTRIES:
+        raise PkgError(f"{count} entries in the file table")
+
+    files = {}
+    for _ in range(count):
+        name = string(MAX_NAME_LENGTH)
+        offset = u32()
+        files[name] = (offset, u32())
+    return version, files, pos
+
+def read_pkg(path):
+    """
+    Summary of a scene.pkg: version, entry count, data size, whether the
+    data it lists is all there and asset counts. Only the pages holding the
+    header and file table are ever read.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise PkgError("empty scene.pkg")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            version, files, data_start = parse_pkg(buf)
+    tracer.count("packages inspected")
+
+    summary = {
+        "version": version,
+        "entries": len(files),
+        "data_size": sum(length for offset, length in files.values()),
+        "truncated": any(data_start + offset + length > size for offset, length in files.values()),
+        "key_files": [name for name in KEY_FILES if name in files],
+    }
+    for kind, extensions in ASSET_KINDS.items():
+        summary[kind] = sum(1 for name in files if name.lower().endswith(extensions))
+    return summary, files
+
+def main_file(entry):
+    """The file project.json says the engine starts from."""
+    if entry.get("file"):
+        return entry["file"]
+    return "scene.json" if (entry.get("type") or "").lower() == "scene" else None
+
+def inspect_item(entry, max_bytes):
+    """
+    Looks at what the engine would load for entry without loading it.
+    Returns (path of the file inspected, scene.pkg summary or None, issues).
+    """
+    subdir = entry["dir"]
+    wallpaper_type = (entry.get("type") or "").lower()
+    start_file = main_file(entry)
+    issues = []
+    if wallpaper_type not in SUPPORTED_TYPES:
+        issues.append(f"{wallpaper_type or 'unknown'} wallpapers are not supported")
+
+    pkg_path = os.path.join(subdir, "scene.pkg")
+    if wallpaper_type == "scene" and os.path.isfile(pkg_path):
+        path = pkg_path
+        try:
+            summary, files = read_pkg(pkg_path)
+        except (OSError, ValueError) as e:
+            return path, None, issues + [f"unreadable scene.pkg: {e}"]
+        if summary["truncated"]:
+            issues.append("scene.pkg is truncated")
+        if start_file and start_file not in files and not os.path.isfile(os.path.join(subdir, start_file)):
+            issues.append(f"scene.pkg has no {start_file}")
+        size = os.path.getsize(pkg_path)
+    else:
+        summary = None
+        path = os.path.join(subdir, start_file) if start_file else None
+        if wallpaper_type in SUPPORTED_TYPES and not (path and os.path.isfile(path)):
+            issues.append(f"missing {'scene.pkg' if wallpaper_type == 'scene' else start_file or 'wallpaper file'}")
+        size = entry.get("file_size") or 0
+
+    if max_bytes and size > max_bytes:
+        issues.append(f"{size / (1024 * 1024):.0f} MB, more than {max_bytes // (1024 * 1024)} MB")
+    return path, summary, issues
+
+def file_state(path):
+    """(mtime, size) of path, None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+class PreflightCache:
+    """
+    Inspection results per wallpaper ID, kept in PREFLIGHT_PATH.
+
+    A result stays valid while project.json and the inspected file have the
+    mtime and size they had when it was made, so rescans only open the
+    packages that changed.
+    """
+
+    def __init__(self, path=PREFLIGHT_PATH, max_bytes=DEFAULT_PREFLIGHT_MAX_MB * 1024 * 1024):
+        self.file = JsonFile(path, "preflight cache")
+        self.max_bytes = max_bytes
+        self.results = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def from_config(cls, config_data, path=PREFLIGHT_PATH):
+        return cls(path, config_data.get("preflight_max_mb", DEFAULT_PREFLIGHT_MAX_MB) * 1024 * 1024)
+
+    def load(self):
+        data = self.file.read()
+        if data.get("version") == PREFLIGHT_VERSION and data.get("max_bytes") == self.max_bytes:
+            self.results = data.get("results", {})
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            results = dict(self.results)
+            self.dirty = False
+        self.file.write({"version": PREFLIGHT_VERSION, "max_bytes": self.max_bytes, "results": results})
+
+    def get(self, wallpaper_id):
+        """The cached result for wallpaper_id if it is still valid, else None."""
+        result = self.results.get(wallpaper_id)
+        if result is None:
+            return None
+        if file_state(os.path.join(result["dir"], "project.json")) != result["project"]:
+            return None
+        if file_state(result["path"]) != result["state"]:
+            return None
+        return result
+
+    def issues(self, wallpaper_id):
+        result = self.get(wallpaper_id)
+        return result["issues"] if result else []
+
+    def inspect(self, wallpaper_id, entry):
+        result = self.get(wallpaper_id)
+        if result is not None and result["dir"] == entry.get("dir"):
+            return result
+
+        with tracer.span("preflight item"):
+            path, summary, issues = inspect_item(entry, self.max_bytes)
+        result = {
+            "dir": entry["dir"],
+            "project": file_state(os.path.join(entry["dir"], "project.json")),
+            "path": path,
+            "state": file_state(path),
+            "pkg": summary,
+            "issues": issues,
+        }
+        with self.lock:
+            self.results[wallpaper_id] = result
+            self.dirty = True
+        return result
+
+    def inspect_all(self, entries, cancelled=None):
+        """
+        Inspects entries ({wallpaper_id: index entry}), returns the IDs with
+        issues mapped to them. Stops early once cancelled (an Event) is set.
+        """
+        flagged = {}
+        with tracer.span("preflight"):
+            for wallpaper_id, entry in entries.items():
+                if cancelled is not None and cancelled.is_set():
+                    break
+                if not entry.get("dir"):
+                    continue
+                issues = self.inspect(wallpaper_id, entry)["issues"]
+                if issues:
+                    flagged[wallpaper_id] = issues
+        self.save()
+        return flagged
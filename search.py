@@ -0,0 +1,144 @@
+import bisect
+import re
+
+from library import wallpaper_type
+from tracing import tracer
+
+# project.json fields that can be searched, besides the workshop ID
+SEARCH_FIELDS = ("title", "tags", "description", "type")
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+def entry_tokens(wallpaper_id, entry):
+    tokens = {wallpaper_id}
+    for field in SEARCH_FIELDS:
+        value = entry.get(field)
+        if isinstance(value, list):
+            value = " ".join(str(v) for v in value)
+        if value:
+            tokens.update(tokenize(str(value)))
+    return tokens
+
+def entry_tags(entry):
+    return [tag for tag in entry.get("tags") or [] if isinstance(tag, str)]
+
+# Sort orders for the grid, every key ends with the ID so the order is total
+SORT_ORDERS = {
+    "title": lambda wallpaper_id, entry: ((entry.get("title") or "").casefold(), wallpaper_id),
+    "added": lambda wallpaper_id, entry: (-(entry.get("added") or 0), wallpaper_id),
+    "size": lambda wallpaper_id, entry: (-(entry.get("file_size") or 0), wallpaper_id),
+    "type": lambda wallpaper_id, entry: (wallpaper_type(entry), (entry.get("title") or "").casefold(), wallpaper_id),
+}
+
+def sort_key(wallpaper_id, entry, order="title", cost=None):
+    if order == "cost":
+        # Cheapest first, wallpapers that were never measured last
+        if cost is None:
+            return (1, 0.0, 0, wallpaper_id)
+        return (0, cost["cpu_percent"], cost["rss"], wallpaper_id)
+    return SORT_ORDERS.get(order, SORT_ORDERS["title"])(wallpaper_id, entry)
+
+class SearchIndex:
+    """
+    Inverted index from words to wallpaper IDs, built from the library
+    entries so searching never touches the disk.
+
+    Every query word matches as a prefix and all words have to match. The
+    vocabulary is kept sorted, a prefix lookup is a bisect plus a walk over
+    the words that share it.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.postings = {}
+        self.tags = {}
+        self.item_tokens = {}
+        self.item_tags = {}
+        self.vocabulary = []
+        self.vocabulary_stale = False
+
+    def __contains__(self, wallpaper_id):
+        return wallpaper_id in self.item_tokens
+
+    def add(self, wallpaper_id, entry):
+        if wallpaper_id in self.item_tokens:
+            self.remove(wallpaper_id)
+
+        tokens = entry_tokens(wallpaper_id, entry)
+        self.item_tokens[wallpaper_id] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                self.vocabulary_stale = True
+            self.postings[token].add(wallpaper_id)
+
+        tags = entry_tags(entry)
+        self.item_tags[wallpaper_id] = tags
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(wallpaper_id)
+
+    def remove(self, wallpaper_id):
+        for token in self.item_tokens.pop(wallpaper_id, ()):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(wallpaper_id)
+                if not ids:
+                    del self.postings[token]
+                    self.vocabulary_stale = True
+        for tag in self.item_tags.pop(wallpaper_id, ()):
+            ids = self.tags.get(tag)
+            if ids is not None:
+                ids.discard(wallpaper_id)
+                if not ids:
+                    del self.tags[tag]
+
+    def build(self, entries):
+        """Indexes a whole scan, entries maps wallpaper IDs to library entries."""
+        with tracer.span("build search index"):
+            self.clear()
+            for wallpaper_id, entry in entries.items():
+                self.add(wallpaper_id, entry)
+            self.refresh_vocabulary()
+
+    def refresh_vocabulary(self):
+        if self.vocabulary_stale:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_stale = False
+
+    def prefix_matches(self, prefix):
+        """IDs of wallpapers with a word starting with prefix."""
+        self.refresh_vocabulary()
+        ids = set()
+        for i in range(bisect.bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            token = self.vocabulary[i]
+            if not token.startswith(prefix):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, query="", tag=None):
+        """
+        IDs matching every word of query and carrying tag, None when neither
+        is given and everything matches.
+        """
+        words = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not words and tag is None:
+            return None
+
+        with tracer.span("search", query=query):
+            ids = set(self.tags.get(tag, ())) if tag is not None else None
+            # Longer words are more selective, starting with them keeps the sets small
+            for word in words:
+                matches = self.prefix_matches(word)
+                ids = matches if ids is None else ids & matches
+                if not ids:
+                    break
+            return ids
+
+    def tag_names(self):
+        return sorted(self.tags, key=str.casefold)
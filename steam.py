@@ -0,0 +1,64 @@
+import os
+import re
+
+# Steam app ID of Wallpaper Engine, workshop items live in steamapps/workshop/content/<id>/
+WALLPAPER_ENGINE_APP_ID = "431960"
+
+# Where Steam keeps libraryfolders.vdf for native, symlinked and Flatpak installs
+LIBRARY_FOLDERS_FILES = (
+    "~/.steam/steam/steamapps/libraryfolders.vdf",
+    "~/.local/share/Steam/steamapps/libraryfolders.vdf",
+    "~/.var/app/com.valvesoftware.Steam/.local/share/Steam/steamapps/libraryfolders.vdf",
+)
+
+VDF_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])')
+
+def parse_vdf(text):
+    """Parses Valve's KeyValues text format into nested dicts."""
+    stack = [{}]
+    key = None
+    for match in VDF_TOKEN_RE.finditer(text):
+        string, brace = match.groups()
+        if brace == "{":
+            child = {}
+            stack[-1][key] = child
+            stack.append(child)
+            key = None
+        elif brace == "}":
+            if len(stack) > 1:
+                stack.pop()
+            key = None
+        elif key is None:
+            key = string.replace("\\\\", "\\")
+        else:
+            stack[-1][key] = string.replace("\\\\", "\\")
+            key = None
+    return stack[0]
+
+def library_folders(vdf_path):
+    """Library paths listed in a libraryfolders.vdf, in Steam's order."""
+    try:
+        with open(vdf_path, "r", encoding="utf-8", errors="replace") as f:
+            data = parse_vdf(f.read())
+    except OSError:
+        return []
+
+    folders = data.get("libraryfolders") or data.get("LibraryFolders") or {}
+    paths = []
+    for key in sorted((k for k in folders if k.isdigit()), key=int):
+        value = folders[key]
+        # Old files map the index straight to the path
+        path = value.get("path") if isinstance(value, dict) else value
+        if path:
+            paths.append(path)
+    return paths
+
+def discover_workshop_dirs():
+    """Wallpaper Engine workshop folders of every Steam library on this machine."""
+    dirs = []
+    for vdf_path in LIBRARY_FOLDERS_FILES:
+        for library in library_folders(os.path.expanduser(vdf_path)):
+            workshop_dir = os.path.join(library, "steamapps", "workshop", "content", WALLPAPER_ENGINE_APP_ID)
+            if os.path.isdir(workshop_dir):
+                dirs.append(workshop_dir)
+    return dirs
@@ -0,0 +1,17 @@
+"""
+Tests run against a throwaway home, cache and runtime directory so they never
+touch the real config, caches or engines:
+
+    python -m unittest discover -s tests -t .
+"""
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_HOME = tempfile.mkdtemp(prefix="wallpaperengine-tests-")
+
+os.environ["HOME"] = TEST_HOME
+os.environ["XDG_CACHE_HOME"] = os.path.join(TEST_HOME, "cache")
+os.environ["XDG_RUNTIME_DIR"] = os.path.join(TEST_HOME, "runtime")
+sys.path.insert(0, REPO_DIR)
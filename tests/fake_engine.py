@@ -0,0 +1,25 @@
+"""
+Stands in for linux-wallpaperengine. Takes the engine's arguments, ignores
+them and runs until it is stopped, unless the file passed with --crash-if
+exists, then it exits with code 3 right away. Its argv stays the same across
+restarts, so the file turns crashing on and off. With --busy it keeps a core
+busy instead of sleeping.
+"""
+import sys
+import time
+
+CRASH_EXIT = 3
+
+def main(args):
+    if "--crash-if" in args:
+        try:
+            with open(args[args.index("--crash-if") + 1], "rb"):
+                return CRASH_EXIT
+        except OSError:
+            pass
+    while True:
+        if "--busy" not in args:
+            time.sleep(60)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,47 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from config import JsonFile
+
+class JsonFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "sub", "data.json")
+
+    def test_missing_reads_empty(self):
+        self.assertEqual(JsonFile(self.path, "data").read(), {})
+
+    def test_write_creates_directory_and_leaves_no_temp_file(self):
+        self.assertTrue(JsonFile(self.path, "data").write({"a": 1}))
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["data.json"])
+        self.assertEqual(JsonFile(self.path, "data").read(), {"a": 1})
+
+    def test_read_if_changed(self):
+        writer = JsonFile(self.path, "data")
+        reader = JsonFile(self.path, "data")
+        writer.write({"a": 1})
+        self.assertEqual(reader.read_if_changed(), {"a": 1})
+        self.assertIsNone(reader.read_if_changed())
+        # Its own writes are not reported back
+        self.assertIsNone(writer.read_if_changed())
+
+        writer.write({"a": 2})
+        self.assertEqual(reader.read_if_changed(), {"a": 2})
+
+    def test_unreadable_reads_empty(self):
+        os.makedirs(os.path.dirname(self.path))
+        for content in ("{broken", json.dumps([1, 2])):
+            with open(self.path, "w") as f:
+                f.write(content)
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(JsonFile(self.path, "data").read(), {})
+            self.assertIn("Failed to read data", output.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
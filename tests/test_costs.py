@@ -0,0 +1,112 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from tests import fake_engine
+from costs import CostStore, process_tree, sample_process, tree_usage
+
+FAKE_ENGINE = os.path.abspath(fake_engine.__file__)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+class FakeProcTest(unittest.TestCase):
+    def setUp(self):
+        self.proc_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.proc_root)
+
+    def add_process(self, pid, ppid, ticks=0, pages=0, state="S", name="linux-wallpaperengine"):
+        os.makedirs(os.path.join(self.proc_root, str(pid)))
+        # state, ppid, nine fields we do not read, then utime and stime
+        fields = [state, str(ppid)] + ["0"] * 9 + [str(ticks), "0", "0"]
+        with open(os.path.join(self.proc_root, str(pid), "stat"), "w") as f:
+            f.write(f"{pid} ({name}) {' '.join(fields)}\n")
+        with open(os.path.join(self.proc_root, str(pid), "statm"), "w") as f:
+            f.write(f"{pages * 2} {pages} 0 0 0 0 0\n")
+
+    def test_tree_includes_descendants_only(self):
+        self.add_process(100, 1, ticks=CLK_TCK, pages=10)
+        # Names may hold spaces and parentheses
+        self.add_process(101, 100, ticks=CLK_TCK, pages=20, name="cef) helper")
+        self.add_process(102, 101, pages=30)
+        self.add_process(200, 1, ticks=50 * CLK_TCK, pages=1000)
+        os.makedirs(os.path.join(self.proc_root, "self"))
+
+        self.assertEqual(sorted(process_tree(100, self.proc_root)), [100, 101, 102])
+        self.assertEqual(tree_usage(100, self.proc_root), (2.0, 60 * PAGE_SIZE))
+
+    def test_sample(self):
+        self.add_process(100, 1, ticks=CLK_TCK, pages=10)
+        self.add_process(101, 100, pages=5)
+
+        result = sample_process(100, 0, 0, interval=0, proc_root=self.proc_root)
+        self.assertEqual(result, {"cpu_percent": 0.0, "rss": 15 * PAGE_SIZE, "rss_max": 15 * PAGE_SIZE})
+
+    def test_gone_or_zombie(self):
+        self.add_process(100, 1, state="Z")
+        self.assertIsNone(tree_usage(100, self.proc_root))
+        self.assertIsNone(tree_usage(101, self.proc_root))
+        self.assertIsNone(sample_process(100, 0, 0, interval=0, proc_root=self.proc_root))
+
+class SampleEngineTest(unittest.TestCase):
+    def run_engine(self, *args):
+        proc = subprocess.Popen([sys.executable, FAKE_ENGINE, *args])
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        return proc
+
+    def test_busy_engine(self):
+        proc = self.run_engine("--busy")
+        result = sample_process(proc.pid, 0, 0.5, interval=0.1)
+        self.assertGreater(result["cpu_percent"], 20)
+        self.assertGreater(result["rss"], 0)
+        self.assertGreaterEqual(result["rss_max"], result["rss"])
+
+    def test_engine_exits_while_sampled(self):
+        crash_flag = tempfile.NamedTemporaryFile()
+        self.addCleanup(crash_flag.close)
+        proc = self.run_engine("--crash-if", crash_flag.name)
+        # The exited engine stays a zombie until it is waited for
+        self.assertIsNone(sample_process(proc.pid, 0.5, 0.5, interval=0.1))
+
+class CostStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "costs.json")
+
+    def test_record_and_get(self):
+        store = CostStore(self.path)
+        self.assertIsNone(store.get("111"))
+        store.record("111", 30, {"cpu_percent": 12.5, "rss": 100})
+
+        cost = store.get("111", 30)
+        self.assertEqual(cost["cpu_percent"], 12.5)
+        self.assertIn("measured", cost)
+        self.assertIsNone(store.get("222"))
+        self.assertEqual(store.costs(30), {"111": cost})
+
+    def test_get_falls_back_to_latest_fps(self):
+        store = CostStore(self.path)
+        store.record("111", None, {"cpu_percent": 40.0, "rss": 100})
+        store.record("111", 15, {"cpu_percent": 8.0, "rss": 100})
+        store.results["111"]["default"]["measured"] -= 60
+
+        self.assertEqual(store.get("111")["cpu_percent"], 40.0)
+        self.assertEqual(store.get("111", 15)["cpu_percent"], 8.0)
+        self.assertEqual(store.get("111", 60)["cpu_percent"], 8.0)
+
+    def test_record_seen_by_other_stores(self):
+        store = CostStore(self.path)
+        other = CostStore(self.path)
+        store.record("111", 30, {"cpu_percent": 5.0, "rss": 100})
+        other.record("222", 30, {"cpu_percent": 50.0, "rss": 100})
+
+        self.assertTrue(store.load())
+        self.assertFalse(store.load())
+        self.assertEqual(sorted(store.costs(30)), ["111", "222"])
+
+if __name__ == "__main__":
+    unittest.main()
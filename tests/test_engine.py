@@ -0,0 +1,43 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from tests import fake_engine
+import engine
+from engine import EngineSupervisor
+
+FAKE_ENGINE = os.path.abspath(fake_engine.__file__)
+
+class EngineSupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.pid_file = os.path.join(self.dir, "engine.pids")
+        self.supervisor = EngineSupervisor(self.pid_file, os.path.join(self.dir, "logs"))
+        self.addCleanup(lambda: self.supervisor.stop(list(self.supervisor.children), timeout=1.0))
+
+    def test_launch_is_tracked(self):
+        proc = self.supervisor.launch([sys.executable, FAKE_ENGINE], screen="DP-1")
+        self.assertEqual(list(self.supervisor.tracked()), [proc.pid])
+
+    def test_unknown_start_time_is_not_tracked(self):
+        with mock.patch.object(engine, "process_start_time", return_value=None):
+            proc = self.supervisor.launch([sys.executable, FAKE_ENGINE], screen="DP-1")
+        self.assertEqual(self.supervisor.tracked(), {})
+        # The supervisor still reaps it
+        self.assertIn(proc.pid, self.supervisor.children)
+
+    def test_records_without_start_time_are_dropped(self):
+        with open(self.pid_file, "w") as f:
+            # A PID that is not running, its start time reads as None too
+            json.dump({"999999999": {"start_time": None, "args": []}}, f)
+        self.assertEqual(self.supervisor.tracked(), {})
+        with open(self.pid_file) as f:
+            self.assertEqual(json.load(f), {})
+
+if __name__ == "__main__":
+    unittest.main()
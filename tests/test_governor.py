@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import governor
+from governor import FpsGovernor, SystemState
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+CPU_COUNT = os.cpu_count() or 1
+ENGINE_PID = 4242
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeSystem:
+    """A sysfs and procfs tree under a temp dir, with setters for what the governor reads."""
+
+    def __init__(self, root):
+        self.sysfs_root = os.path.join(root, "sys")
+        self.proc_root = os.path.join(root, "proc")
+        self.supply_dir = os.path.join(self.sysfs_root, "class", "power_supply")
+        os.makedirs(self.supply_dir)
+        os.makedirs(os.path.join(self.proc_root, str(ENGINE_PID)))
+        self.ticks = 0
+        self.set_load(0.0)
+        self.set_engine_ticks(0)
+
+    def write(self, path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
+
+    def set_supply(self, name, supply_type, **values):
+        for key, value in dict(values, type=supply_type).items():
+            self.write(os.path.join(self.supply_dir, name, key), value)
+
+    def set_load(self, per_cpu):
+        self.write(os.path.join(self.proc_root, "loadavg"), f"{per_cpu * CPU_COUNT:.2f} 0.00 0.00 1/100 {ENGINE_PID}")
+
+    def set_engine_ticks(self, ticks):
+        fields = ["S", "1"] + ["0"] * 9 + [str(ticks), "0"]
+        self.write(os.path.join(self.proc_root, str(ENGINE_PID), "stat"), f"{ENGINE_PID} (linux-wallpaperengine) {' '.join(fields)}")
+
+class GovernorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.system = FakeSystem(self.dir)
+        self.clock = FakeClock()
+        self.enterContext(mock.patch.object(governor.time, "monotonic", self.clock))
+        self.state = SystemState(self.system.sysfs_root, self.system.proc_root)
+
+    def engine_runs(self, cpu_percent, seconds=10):
+        """Advances the clock with the engine using cpu_percent of a core meanwhile."""
+        self.clock.now += seconds
+        self.system.ticks += round(cpu_percent / 100 * seconds * CLK_TCK)
+        self.system.set_engine_ticks(self.system.ticks)
+
+class SystemStateTest(GovernorTestCase):
+    def test_no_power_supply(self):
+        self.assertEqual(self.state.power(), (False, None))
+
+    def test_on_battery(self):
+        self.system.set_supply("AC", "Mains", online=0)
+        self.system.set_supply("BAT0", "Battery", capacity=40, status="Discharging")
+        self.system.set_supply("BAT1", "Battery", capacity=70, status="Discharging")
+        self.assertEqual(self.state.power(), (True, 40))
+
+    def test_on_ac(self):
+        self.system.set_supply("AC", "Mains", online=1)
+        self.system.set_supply("BAT0", "Battery", capacity=40, status="Discharging")
+        self.assertEqual(self.state.power(), (False, 40))
+
+    def test_charging_battery_means_ac(self):
+        self.system.set_supply("BAT0", "Battery", capacity=40, status="Charging")
+        self.assertEqual(self.state.power(), (False, 40))
+
+    def test_load_per_cpu(self):
+        self.system.set_load(0.5)
+        self.assertAlmostEqual(self.state.load(), 0.5, places=2)
+
+    def test_engine_cpu(self):
+        # The first sample only sets the baseline
+        self.assertEqual(self.state.engine_cpu([ENGINE_PID]), 0.0)
+        self.engine_runs(50, seconds=2)
+        self.assertAlmostEqual(self.state.engine_cpu([ENGINE_PID]), 50, delta=1)
+        self.assertEqual(self.state.engine_cpu([ENGINE_PID + 1]), 0.0)
+
+class FpsGovernorTest(GovernorTestCase):
+    def governor(self, rules, dwell=3):
+        return FpsGovernor(rules, dwell, self.state)
+
+    def update(self, governor, times, base_fps="30"):
+        return [governor.update([ENGINE_PID], base_fps) for _ in range(times)]
+
+    def test_dwell(self):
+        gov = self.governor([{"load_above": 0.8, "fps": 10}])
+        self.system.set_load(0.9)
+        self.assertEqual(self.update(gov, 2), [False, False])
+        # An interrupted run starts over
+        self.system.set_load(0.1)
+        self.assertEqual(self.update(gov, 1), [False])
+        self.system.set_load(0.9)
+        self.assertEqual(self.update(gov, 3), [False, False, True])
+        self.assertEqual(gov.fps("30"), 10)
+        self.assertEqual(self.update(gov, 1), [False])
+
+    def test_hysteresis(self):
+        gov = self.governor([{"load_above": 0.8, "fps": 10}], dwell=1)
+        self.system.set_load(0.85)
+        self.assertEqual(self.update(gov, 1), [True])
+        # Within HYSTERESIS of the threshold the rule holds on
+        self.system.set_load(0.75)
+        self.assertEqual(self.update(gov, 1), [False])
+        self.assertEqual(gov.tier, 0)
+        self.system.set_load(0.65)
+        self.assertEqual(self.update(gov, 1), [True])
+        self.assertIsNone(gov.tier)
+        # Inactive, the rule needs the real threshold again
+        self.system.set_load(0.75)
+        self.assertEqual(self.update(gov, 1), [False])
+
+    def test_first_matching_rule_wins(self):
+        gov = self.governor([{"on_battery": True, "battery_below": 20, "fps": 5}, {"on_battery": True, "fps": 15}], dwell=1)
+        self.system.set_supply("BAT0", "Battery", capacity=50, status="Discharging")
+        self.update(gov, 1)
+        self.assertEqual(gov.fps("30"), 15)
+        self.system.set_supply("BAT0", "Battery", capacity=10, status="Discharging")
+        self.update(gov, 1)
+        self.assertEqual(gov.fps("30"), 5)
+
+    def test_never_raises_fps(self):
+        gov = self.governor([{"load_above": 0.8, "fps": 15}], dwell=1)
+        self.system.set_load(0.9)
+        self.update(gov, 1, base_fps="10")
+        self.assertEqual(gov.tier, 0)
+        self.assertEqual(gov.fps("10"), "10")
+        self.assertEqual(gov.fps("30"), 15)
+        self.assertEqual(gov.fps(None), 15)
+
+    def test_engine_cpu_rule_survives_its_own_throttling(self):
+        gov = self.governor([{"engine_cpu_above": 50, "fps": 15}], dwell=1)
+        self.update(gov, 1)
+        self.engine_runs(60)
+        self.assertEqual(self.update(gov, 1), [True])
+        self.assertEqual(gov.fps("30"), 15)
+
+        # At half the fps the engine uses about half the CPU, which still counts as 60%
+        for _ in range(3):
+            self.engine_runs(30)
+            self.assertEqual(self.update(gov, 1), [False])
+        self.assertEqual(gov.tier, 0)
+
+        # It lets go once the engine got cheaper for real
+        self.engine_runs(15)
+        self.assertEqual(self.update(gov, 1), [True])
+        self.assertEqual(gov.fps("30"), "30")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from tests import fake_engine
+from engine import EngineSupervisor
+from watchdog import CrashLog, EngineWatchdog
+
+FAKE_ENGINE = os.path.abspath(fake_engine.__file__)
+
+class WatchdogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.crash_flag = os.path.join(self.dir, "crash")
+        self.supervisor = EngineSupervisor(os.path.join(self.dir, "engine.pids"), os.path.join(self.dir, "logs"))
+        self.output = io.StringIO()
+        self.enterContext(contextlib.redirect_stdout(self.output))
+
+    def tearDown(self):
+        self.supervisor.stop(list(self.supervisor.children), timeout=1.0)
+        shutil.rmtree(self.dir)
+
+    def crash_log(self, limit=3, window=600):
+        return CrashLog(os.path.join(self.dir, "crashes.json"), limit, window)
+
+    def launch(self, wallpaper_id="111", screen="DP-1"):
+        args = [sys.executable, FAKE_ENGINE, "--crash-if", self.crash_flag, "--screen-root", screen, "--bg", wallpaper_id]
+        return self.supervisor.launch(args, screen=screen)
+
+    def crash_next(self, crash=True):
+        if crash:
+            open(self.crash_flag, "w").close()
+        elif os.path.exists(self.crash_flag):
+            os.remove(self.crash_flag)
+
+    def wait_for_exit(self):
+        for proc in list(self.supervisor.children.values()):
+            proc.wait(timeout=10)
+
+    def poll_until_restarted(self, watchdog, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not self.supervisor.children:
+            self.assertLess(time.monotonic(), deadline, "engine was not restarted")
+            time.sleep(0.01)
+            watchdog.poll()
+
+class EngineWatchdogTest(WatchdogTestCase):
+    def test_backoff_doubles_up_to_max(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(limit=100), backoff_initial=0.05, backoff_max=0.2)
+        self.crash_next()
+        self.launch()
+
+        delays = []
+        for _ in range(4):
+            self.wait_for_exit()
+            watchdog.poll()
+            delays.append(watchdog.backoff["DP-1"])
+            self.assertIn("DP-1", watchdog.pending)
+            self.poll_until_restarted(watchdog)
+        self.assertEqual(delays, [0.1, 0.2, 0.2, 0.2])
+
+    def test_restart_keeps_argv(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(), backoff_initial=0)
+        self.crash_next()
+        args = self.launch().args
+        self.wait_for_exit()
+        self.crash_next(False)
+        watchdog.poll()
+
+        (proc,) = self.supervisor.children.values()
+        self.assertEqual(proc.args, args)
+        self.assertIsNone(proc.poll())
+
+    def test_restarts_count_crashes_only(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(limit=100), backoff_initial=0)
+        self.crash_next()
+        self.launch()
+        for crash in (True, True, False):
+            self.wait_for_exit()
+            self.crash_next(crash)
+            watchdog.poll()
+        self.assertEqual([record["restarts"] for record in self.supervisor.tracked().values()], [3])
+
+        # Switching wallpapers is not a restart
+        self.supervisor.stop(list(self.supervisor.children))
+        self.launch("222")
+        self.assertEqual([record["restarts"] for record in self.supervisor.tracked().values()], [0])
+
+    def test_clean_exit_is_not_restarted(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(), backoff_initial=0)
+        proc = self.launch()
+        proc.terminate()
+        proc.wait(timeout=10)
+
+        self.assertEqual(watchdog.poll(), [])
+        self.assertEqual(self.supervisor.children, {})
+        self.assertEqual(watchdog.pending, {})
+        self.assertEqual(watchdog.crash_log.crashes, {})
+
+    def test_stop_drops_pending_restarts(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(), backoff_initial=60)
+        self.crash_next()
+        self.launch()
+        self.wait_for_exit()
+        watchdog.poll()
+        self.assertIn("DP-1", watchdog.pending)
+
+        self.supervisor.stop([])
+        watchdog.poll()
+        self.assertEqual(watchdog.pending, {})
+
+    def test_quarantine_after_crash_limit(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(limit=3), backoff_initial=0)
+        self.crash_next()
+        self.launch()
+
+        for _ in range(2):
+            self.wait_for_exit()
+            self.assertEqual(watchdog.poll(), [])
+            self.assertEqual(len(self.supervisor.children), 1)
+
+        self.wait_for_exit()
+        self.assertEqual(watchdog.poll(), ["111"])
+        self.assertEqual(self.supervisor.children, {})
+        self.assertEqual(watchdog.pending, {})
+        self.assertEqual(watchdog.crash_log.quarantined()["111"]["crashes"], 3)
+
+    def test_quarantined_wallpaper_is_left_out_of_restart(self):
+        watchdog = EngineWatchdog(self.supervisor, self.crash_log(limit=100), backoff_initial=0)
+        self.crash_next()
+        args = [
+            sys.executable, FAKE_ENGINE, "--crash-if", self.crash_flag,
+            "--screen-root", "DP-1", "--bg", "111", "--screen-root", "DP-2", "--bg", "222",
+        ]
+        self.supervisor.launch(args)
+        watchdog.crash_log.quarantine["222"] = {"since": 0, "crashes": 3}
+        watchdog.crash_log.save()
+        self.wait_for_exit()
+        self.crash_next(False)
+        watchdog.poll()
+
+        (proc,) = self.supervisor.children.values()
+        self.assertEqual(proc.args[-4:], ["--screen-root", "DP-1", "--bg", "111"])
+
+class CrashLogTest(WatchdogTestCase):
+    def test_crashes_outside_window_do_not_count(self):
+        crash_log = self.crash_log(limit=2, window=600)
+        self.assertEqual(crash_log.record(["111"], when=1000), [])
+        self.assertEqual(crash_log.record(["111"], when=1700), [])
+        self.assertEqual(crash_log.record(["111"], when=1800), ["111"])
+        self.assertEqual(crash_log.quarantined(), {"111": {"since": 1800, "crashes": 2}})
+
+    def test_quarantined_once(self):
+        crash_log = self.crash_log(limit=1)
+        self.assertEqual(crash_log.record(["111", "222"], when=1000), ["111", "222"])
+        self.assertEqual(crash_log.record(["111"], when=1001), [])
+
+    def test_release(self):
+        crash_log = self.crash_log(limit=2)
+        crash_log.record(["111"], when=1000)
+        crash_log.record(["111"], when=1001)
+
+        self.assertTrue(crash_log.release("111"))
+        self.assertEqual(crash_log.quarantined(), {})
+        # Its crashes are forgotten too, one more is not enough to quarantine it again
+        self.assertEqual(crash_log.record(["111"], when=1002), [])
+        self.assertFalse(crash_log.release("111"))
+        self.assertFalse(crash_log.release("222"))
+
+    def test_release_seen_by_other_processes(self):
+        crash_log = self.crash_log(limit=1)
+        other = self.crash_log(limit=1)
+        crash_log.record(["111"], when=1000)
+        self.assertIn("111", other.quarantined())
+
+        self.assertTrue(other.release("111"))
+        self.assertEqual(crash_log.quarantined(), {})
+
+if __name__ == "__main__":
+    unittest.main()
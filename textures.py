@@ -0,0 +1,62 @@
+import gi
+gi.require_version('Gdk', '4.0')
+from gi.repository import Gdk
+import collections
+
+from tracing import tracer
+
+DEFAULT_TEXTURE_CACHE_MB = 64
+
+class TextureCache:
+    """
+    Process-wide LRU of preview textures keyed by (wallpaper ID, width,
+    scale factor), shared by the grid tiles and the sidebar preview.
+
+    Textures are charged at 4 bytes per pixel against max_bytes. An evicted
+    texture stays alive for as long as a widget still shows it, it just has
+    to be decoded again the next time it is needed.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_TEXTURE_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.textures = collections.OrderedDict()
+        self.total = 0
+
+    def get(self, key):
+        entry = self.textures.get(key)
+        if entry is None:
+            tracer.count("texture cache misses")
+            return None
+        self.textures.move_to_end(key)
+        tracer.count("texture cache hits")
+        return entry[0]
+
+    def add(self, key, pixbuf):
+        """Turns pixbuf into a texture, caches it under key and returns it."""
+        with tracer.span("create texture"):
+            texture = Gdk.Texture.new_for_pixbuf(pixbuf)
+        size = texture.get_width() * texture.get_height() * 4
+
+        self.discard(key)
+        self.textures[key] = (texture, size)
+        self.total += size
+        while self.total > self.max_bytes and len(self.textures) > 1:
+            _, (_, evicted_size) = self.textures.popitem(last=False)
+            self.total -= evicted_size
+            tracer.count("texture cache evictions")
+        return texture
+
+    def discard(self, key):
+        entry = self.textures.pop(key, None)
+        if entry is not None:
+            self.total -= entry[1]
+
+    def invalidate(self, wallpaper_ids):
+        """Drops every size of the given wallpapers, for previews that changed on disk."""
+        wallpaper_ids = set(wallpaper_ids)
+        for key in [key for key in self.textures if key[0] in wallpaper_ids]:
+            self.discard(key)
+
+    def clear(self):
+        self.textures.clear()
+        self.total = 0
@@ -0,0 +1,300 @@
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import hashlib
+import os
+import threading
+import time
+
+from config import CACHE_DIR
+from tracing import tracer
+
+# Thumbnails follow the freedesktop thumbnail spec layout (md5 of the source
+# URI, Thumb::URI / Thumb::MTime stored in the PNG) but live in our own cache
+# dir with one folder per pixel width, since the spec sizes don't match ours.
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+
+DEFAULT_CACHE_SIZE_MB = 256
+
+def thumbnail_path(img_path, width):
+    uri = GLib.filename_to_uri(os.path.abspath(img_path), None)
+    name = hashlib.md5(uri.encode("utf-8")).hexdigest() + ".png"
+    return os.path.join(THUMBNAIL_DIR, str(width), name), uri
+
+# Previews are read in chunks so the loader can start decoding before the file is in memory
+READ_CHUNK_SIZE = 64 * 1024
+
+# Anything bigger is not a preview anyone meant to ship, refuse it instead of stalling a worker
+MAX_PREVIEW_BYTES = 64 * 1024 * 1024
+MAX_PREVIEW_PIXELS = 64 * 1024 * 1024
+
+def read_sub_blocks(f, out):
+    while True:
+        size = f.read(1)
+        out += size
+        if not size or size == b"\x00":
+            return
+        out += f.read(size[0])
+
+def read_gif_first_frame(f):
+    """
+    The bytes of a GIF up to the end of its first image plus the trailer, so
+    the loader never sees the other frames. None if the file is not a GIF.
+    """
+    out = bytearray(f.read(13))
+    if len(out) < 13 or not out.startswith(b"GIF8"):
+        return None
+    # Global color table
+    if out[10] & 0x80:
+        out += f.read(3 << ((out[10] & 7) + 1))
+
+    while True:
+        block = f.read(1)
+        if not block or block == b"\x3b":
+            break
+        out += block
+        if block == b"\x21":
+            # Extension: label, then data sub-blocks
+            out += f.read(1)
+            read_sub_blocks(f, out)
+        elif block == b"\x2c":
+            # Image descriptor, local color table, LZW code size, image data
+            descriptor = f.read(9)
+            out += descriptor
+            if len(descriptor) < 9:
+                break
+            if descriptor[8] & 0x80:
+                out += f.read(3 << ((descriptor[8] & 7) + 1))
+            out += f.read(1)
+            read_sub_blocks(f, out)
+            break
+        else:
+            break
+    return bytes(out + b"\x3b")
+
+def scale_preview(img_path, target_width):
+    with tracer.span("decode preview"):
+        return decode_preview(img_path, target_width)
+
+def decode_preview(img_path, target_width):
+    """
+    Decodes img_path straight to target_width in one pass. The size is set
+    from size-prepared, before any pixel is decoded, so loaders that can
+    scale while decoding (JPEG) never build the full size image, and GIFs
+    only get their first frame.
+    """
+    size = os.path.getsize(img_path)
+    if size > MAX_PREVIEW_BYTES:
+        raise ValueError(f"{img_path} is {size} bytes, previews are capped at {MAX_PREVIEW_BYTES}")
+
+    too_large = []
+
+    def on_size_prepared(loader, width, height):
+        if width * height > MAX_PREVIEW_PIXELS:
+            too_large.append((width, height))
+            return
+        loader.set_size(target_width, max(1, round(height * target_width / width)))
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.connect("size-prepared", on_size_prepared)
+    fed = 0
+    try:
+        with open(img_path, "rb") as f:
+            first_frame = read_gif_first_frame(f)
+            if first_frame is not None:
+                loader.write(first_frame)
+                fed = len(first_frame)
+            else:
+                f.seek(0)
+                for data in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                    loader.write(data)
+                    fed += len(data)
+                    if too_large:
+                        break
+    finally:
+        try:
+            loader.close()
+        except GLib.Error:
+            # Closing after stopping early reports the image as truncated
+            if not too_large:
+                raise
+    tracer.count("bytes decoded", fed)
+
+    if too_large:
+        width, height = too_large[0]
+        raise ValueError(f"{img_path} is {width}x{height}, previews are capped at {MAX_PREVIEW_PIXELS} pixels")
+    pixbuf = loader.get_pixbuf()
+    if pixbuf is None:
+        raise ValueError(f"Could not decode {img_path}")
+
+    # Loaders that can't scale leave it to the caller
+    if pixbuf.get_width() != target_width:
+        height = max(1, round(pixbuf.get_height() * target_width / pixbuf.get_width()))
+        pixbuf = pixbuf.scale_simple(target_width, height, GdkPixbuf.InterpType.BILINEAR)
+    return pixbuf
+
+def load_thumbnail(img_path, width):
+    """Returns the cached thumbnail for img_path, None if missing or stale."""
+    path, uri = thumbnail_path(img_path, width)
+    try:
+        mtime = str(int(os.stat(img_path).st_mtime))
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+    except Exception:
+        return None
+
+    if pixbuf.get_option("tEXt::Thumb::URI") != uri or pixbuf.get_option("tEXt::Thumb::MTime") != mtime:
+        return None
+    tracer.count("thumbnail cache hits")
+
+    # Bump the file mtime so pruning evicts the least recently used thumbnails
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return pixbuf
+
+def save_thumbnail(img_path, width, pixbuf):
+    path, uri = thumbnail_path(img_path, width)
+    try:
+        mtime = str(int(os.stat(img_path).st_mtime))
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        # Write to a temp file first so a half written thumbnail is never picked up
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pixbuf.savev(tmp_path, "png", ["tEXt::Thumb::URI", "tEXt::Thumb::MTime"], [uri, mtime])
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Failed to write thumbnail for {img_path}: {e}")
+
+def get_thumbnail(img_path, width):
+    with tracer.span("load thumbnail"):
+        pixbuf = load_thumbnail(img_path, width)
+    if pixbuf is None:
+        tracer.count("thumbnail cache misses")
+        pixbuf = scale_preview(img_path, width)
+        save_thumbnail(img_path, width, pixbuf)
+    return pixbuf
+
+def prune_thumbnails(max_size_mb=DEFAULT_CACHE_SIZE_MB):
+    """Evicts the least recently used thumbnails until the cache fits in max_size_mb."""
+    thumbnails = []
+    total = 0
+    for root, dirs, files in os.walk(THUMBNAIL_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # Leftovers from interrupted writes are always dropped
+            if name.endswith(".tmp"):
+                thumbnails.append((0, st.st_size, path))
+            else:
+                thumbnails.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    removed = 0
+    max_bytes = max_size_mb * 1024 * 1024
+    thumbnails.sort()
+    for mtime, size, path in thumbnails:
+        if total <= max_bytes and mtime:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed, total
+
+class LoaderJob:
+    """A batch of background work that can be cancelled as a whole."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.futures = set()
+
+    def add(self, future):
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+
+    def cancel(self):
+        self.cancelled.set()
+        for future in list(self.futures):
+            future.cancel()
+
+class ThumbnailLoader:
+    """
+    Runs scans and decodes on a worker pool and hands the results back to the
+    GTK main loop in batches, spending at most FRAME_BUDGET seconds per idle
+    callback so the window keeps redrawing while previews stream in.
+    """
+
+    FRAME_BUDGET = 0.008
+
+    def __init__(self, max_workers=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or os.cpu_count() or 4,
+            thread_name_prefix="thumbnails",
+        )
+        self.results = collections.deque()
+        self.lock = threading.Lock()
+        self.idle_id = None
+        self.job = None
+
+    def start_job(self):
+        """Cancels the running job and returns a fresh one."""
+        if self.job:
+            self.job.cancel()
+        self.job = LoaderJob()
+        return self.job
+
+    def submit(self, job, callback, fn, *args):
+        """
+        Runs fn(*args) on the pool, then callback(result) on the main loop
+        unless job was cancelled or callback is None. Returns the future so single tasks can be
+        cancelled too.
+        """
+        if job.cancelled.is_set():
+            return None
+        future = self.executor.submit(self._run, job, callback, fn, args)
+        job.add(future)
+        return future
+
+    def _run(self, job, callback, fn, args):
+        if job.cancelled.is_set():
+            return
+        try:
+            result = fn(*args)
+        except Exception as e:
+            print(f"Background task failed: {e}")
+            result = None
+        if callback is not None:
+            self.post(job, callback, result)
+
+    def post(self, job, callback, result):
+        """Queues callback(result) for the main loop, also usable from inside a running task."""
+        if job.cancelled.is_set():
+            return
+        with self.lock:
+            self.results.append((job, callback, result))
+            if self.idle_id is None:
+                self.idle_id = GLib.idle_add(self._drain)
+
+    def _drain(self):
+        deadline = time.monotonic() + self.FRAME_BUDGET
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.results:
+                    self.idle_id = None
+                    return GLib.SOURCE_REMOVE
+                job, callback, result = self.results.popleft()
+            if not job.cancelled.is_set():
+                callback(result)
+        return GLib.SOURCE_CONTINUE
+
+    def shutdown(self):
+        if self.job:
+            self.job.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
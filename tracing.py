@@ -0,0 +1,101 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+class Tracer:
+    """
+    Collects timed spans and counters for `--profile`.
+
+    Disabled by default; span() then hands out a shared no-op context
+    manager and count() returns right away, so the instrumentation can stay
+    in hot paths.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.monotonic_ns()
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.origin = time.monotonic_ns()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._span(name, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, args):
+        start = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            end = time.monotonic_ns()
+            with self.lock:
+                self.spans.append((name, start, end, threading.get_ident(), args))
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """Maps span names to (calls, total ms, max ms)."""
+        totals = {}
+        with self.lock:
+            spans = list(self.spans)
+        for name, start, end, tid, args in spans:
+            calls, total, longest = totals.get(name, (0, 0, 0))
+            duration = end - start
+            totals[name] = (calls + 1, total + duration, max(longest, duration))
+        return {name: (calls, total / 1e6, longest / 1e6) for name, (calls, total, longest) in totals.items()}
+
+    def format_summary(self):
+        lines = [f"{'phase':<24} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, (calls, total, longest) in sorted(self.summary().items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<24} {calls:>7} {total:>10.1f} {total / calls:>9.2f} {longest:>9.2f}")
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'counter':<24} {'value':>7}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<24} {value:>7}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """The spans in Chrome trace event format, loadable in chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, end, tid, args in spans
+        ]
+        end = max((span[2] for span in spans), default=self.origin)
+        events.append({"name": "counters", "ph": "C", "ts": (end - self.origin) / 1000, "pid": pid, "args": counters})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.chrome_trace(), f)
+            print(f"Wrote trace to {path}")
+        except Exception as e:
+            print(f"Failed to write trace: {e}")
+
+tracer = Tracer()
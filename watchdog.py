@@ -0,0 +1,190 @@
+import os
+import signal
+import time
+
+from config import CACHE_DIR, JsonFile
+
+CRASH_FILE = os.path.join(CACHE_DIR, "crashes.json")
+
+# A wallpaper that crashed the engine this often within the window (seconds) is
+# quarantined, config.json "crash_limit" and "crash_window"
+DEFAULT_CRASH_LIMIT = 3
+DEFAULT_CRASH_WINDOW = 600
+
+# Restart delays double from BACKOFF_INITIAL up to BACKOFF_MAX, an engine that
+# ran for STABLE_AFTER seconds before it crashed starts over at BACKOFF_INITIAL
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 60.0
+STABLE_AFTER = 60.0
+
+# Seconds between two looks for engines that exited
+WATCH_INTERVAL = 1
+
+# Exits that mean the engine was stopped on purpose
+CLEAN_EXITS = (0, -signal.SIGTERM, -signal.SIGINT)
+
+def engine_wallpapers(args):
+    """Wallpaper IDs an engine's argv passes with --bg."""
+    return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "--bg"]
+
+def drop_wallpapers(args, wallpaper_ids):
+    """args without the --screen-root/--bg pairs of wallpaper_ids."""
+    result = []
+    i = 0
+    while i < len(args):
+        if args[i] == "--screen-root" and args[i + 2:i + 3] == ["--bg"] and args[i + 3:i + 4] and args[i + 3] in wallpaper_ids:
+            i += 4
+            continue
+        result.append(args[i])
+        i += 1
+    return result
+
+def describe_exit(returncode):
+    if returncode < 0:
+        try:
+            return signal.Signals(-returncode).name
+        except ValueError:
+            return f"signal {-returncode}"
+    return f"exit code {returncode}"
+
+class CrashLog:
+    """
+    Crash times per wallpaper ID and the IDs quarantined for crashing too
+    often, kept in CRASH_FILE. The file is re-read when it changes, so the
+    GUI sees what the daemon quarantined and the other way round.
+    """
+
+    def __init__(self, path=CRASH_FILE, limit=DEFAULT_CRASH_LIMIT, window=DEFAULT_CRASH_WINDOW):
+        self.file = JsonFile(path, "crash log", indent=2)
+        self.limit = limit
+        self.window = window
+        self.crashes = {}
+        self.quarantine = {}
+
+    @classmethod
+    def from_config(cls, config_data, path=CRASH_FILE):
+        return cls(
+            path,
+            config_data.get("crash_limit", DEFAULT_CRASH_LIMIT),
+            config_data.get("crash_window", DEFAULT_CRASH_WINDOW),
+        )
+
+    def load(self):
+        data = self.file.read_if_changed()
+        if data is not None:
+            self.crashes = data.get("crashes", {})
+            self.quarantine = data.get("quarantined", {})
+
+    def save(self):
+        self.file.write({"crashes": self.crashes, "quarantined": self.quarantine})
+
+    def quarantined(self):
+        """Maps quarantined wallpaper IDs to {"since", "crashes"}."""
+        self.load()
+        return dict(self.quarantine)
+
+    def record(self, wallpaper_ids, when=None):
+        """Counts a crash for wallpaper_ids, returns the ones that got quarantined by it."""
+        self.load()
+        when = time.time() if when is None else when
+        newly_quarantined = []
+        for wallpaper_id in wallpaper_ids:
+            crashes = [t for t in self.crashes.get(wallpaper_id, []) if t > when - self.window]
+            crashes.append(when)
+            self.crashes[wallpaper_id] = crashes
+            if len(crashes) >= self.limit and wallpaper_id not in self.quarantine:
+                self.quarantine[wallpaper_id] = {"since": when, "crashes": len(crashes)}
+                newly_quarantined.append(wallpaper_id)
+        self.save()
+        return newly_quarantined
+
+    def release(self, wallpaper_id):
+        """Lets wallpaper_id run again and forgets its crashes, returns False if it was not quarantined."""
+        self.load()
+        self.crashes.pop(wallpaper_id, None)
+        if self.quarantine.pop(wallpaper_id, None) is None:
+            return False
+        self.save()
+        return True
+
+class EngineWatchdog:
+    """
+    Restarts the engines of a supervisor that exited on their own.
+
+    poll() reaps the engines that exited since the last call, counts a crash
+    for their wallpapers in crash_log and restarts them with the same argv
+    after a delay that doubles with every crash in a row. Quarantined
+    wallpapers are left out of the restart. Only engines started by this
+    process can be reaped, so the watchdog runs where the engines are
+    started: in the daemon, or in the GUI when there is none.
+    """
+
+    def __init__(self, supervisor, crash_log, backoff_initial=BACKOFF_INITIAL, backoff_max=BACKOFF_MAX, stable_after=STABLE_AFTER):
+        self.supervisor = supervisor
+        self.crash_log = crash_log
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        # Screen (None for an engine on every screen) -> (due, record)
+        self.pending = {}
+        # Screen -> delay of its next restart
+        self.backoff = {}
+        self.stop_count = supervisor.stop_count
+
+    def poll(self):
+        """Reaps exited engines and starts the restarts that are due, returns the newly quarantined IDs."""
+        now = time.monotonic()
+        # Engines were stopped or replaced since, restarts planned before that are void
+        if self.supervisor.stop_count != self.stop_count:
+            self.stop_count = self.supervisor.stop_count
+            self.pending = {}
+
+        newly_quarantined = []
+        for pid, returncode, record in self.supervisor.reap():
+            screen = record.get("screen")
+            name = screen or "all"
+            if returncode in CLEAN_EXITS:
+                print(f"Engine {pid} ({name}) exited with {describe_exit(returncode)}, not restarting it")
+                continue
+
+            uptime = time.time() - record.get("started", time.time())
+            print(f"Engine {pid} ({name}) crashed with {describe_exit(returncode)} after {uptime:.0f}s")
+            for wallpaper_id in self.crash_log.record(engine_wallpapers(record.get("args") or [])):
+                print(f"Quarantined {wallpaper_id} after {self.crash_log.limit} crashes, assign it again to retry")
+                newly_quarantined.append(wallpaper_id)
+
+            if not engine_wallpapers(drop_wallpapers(record.get("args") or [], self.crash_log.quarantined())):
+                print(f"Not restarting {name}, its wallpaper is quarantined")
+                continue
+
+            if uptime >= self.stable_after:
+                self.backoff.pop(screen, None)
+            delay = self.backoff.get(screen, self.backoff_initial)
+            self.backoff[screen] = min(delay * 2, self.backoff_max)
+            self.pending[screen] = (now + delay, record)
+            print(f"Restarting {name} in {delay:g}s")
+
+        for screen, (due, record) in list(self.pending.items()):
+            if due <= now:
+                del self.pending[screen]
+                self.restart(screen, record)
+        return newly_quarantined
+
+    def restart(self, screen, record):
+        # An apply may have put an engine on this screen meanwhile
+        for other in self.supervisor.tracked().values():
+            if screen is None or other.get("screen") in (screen, None):
+                return
+
+        args = drop_wallpapers(record["args"], self.crash_log.quarantined())
+        if not engine_wallpapers(args):
+            print(f"Not restarting {screen or 'all'}, its wallpaper is quarantined")
+            return
+
+        try:
+            self.supervisor.launch(
+                args, screen=screen, spec=record.get("spec"),
+                log_max_bytes=record.get("log_max_bytes") or 0, restarts=record.get("restarts", 0) + 1,
+            )
+        except Exception as e:
+            print("Failed to restart wallpaper engine:", e)
@@ -0,0 +1,111 @@
+from gi.repository import Gio, GLib
+import os
+
+class WorkshopWatcher:
+    """
+    Watches the workshop folder and every <id>/ folder inside it with
+    Gio.FileMonitor (inotify on Linux).
+
+    Events are collected per item folder and reported to on_changes(item_dirs)
+    once no new event arrived for DEBOUNCE_MS, so Steam unpacking hundreds of
+    files for one item results in a single update. Folders that changed keep
+    being reported at least every MAX_DELAY_MS during long downloads.
+    """
+
+    DEBOUNCE_MS = 1000
+    MAX_DELAY_MS = 5000
+
+    def __init__(self, workshop_dir, on_changes):
+        self.workshop_dir = os.path.abspath(workshop_dir)
+        self.on_changes = on_changes
+        self.root_monitor = None
+        self.item_monitors = {}
+        self.pending = set()
+        self.timeout_id = None
+        self.first_event = None
+
+    def start(self):
+        try:
+            self.root_monitor = Gio.File.new_for_path(self.workshop_dir).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None
+            )
+        except GLib.Error as e:
+            print(f"Failed to watch {self.workshop_dir}: {e}")
+            return
+        self.root_monitor.connect("changed", self.on_root_changed)
+
+        try:
+            with os.scandir(self.workshop_dir) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        self.watch_item(entry.path)
+        except OSError as e:
+            print(f"Failed to list {self.workshop_dir}: {e}")
+
+    def stop(self):
+        if self.timeout_id is not None:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = None
+        for monitor in self.item_monitors.values():
+            monitor.cancel()
+        self.item_monitors = {}
+        if self.root_monitor:
+            self.root_monitor.cancel()
+            self.root_monitor = None
+        self.pending = set()
+
+    def watch_item(self, item_dir):
+        if item_dir in self.item_monitors:
+            return
+        try:
+            monitor = Gio.File.new_for_path(item_dir).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+        except GLib.Error:
+            return
+        monitor.connect("changed", self.on_item_changed, item_dir)
+        self.item_monitors[item_dir] = monitor
+
+    def unwatch_item(self, item_dir):
+        monitor = self.item_monitors.pop(item_dir, None)
+        if monitor:
+            monitor.cancel()
+
+    def on_root_changed(self, monitor, file, other_file, event_type):
+        path = file.get_path()
+        if event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.MOVED_IN):
+            if os.path.isdir(path):
+                self.watch_item(path)
+                self.queue(path)
+        elif event_type in (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT):
+            self.unwatch_item(path)
+            self.queue(path)
+        elif event_type == Gio.FileMonitorEvent.RENAMED:
+            self.unwatch_item(path)
+            self.queue(path)
+            new_path = other_file.get_path() if other_file else None
+            if new_path and os.path.isdir(new_path):
+                self.watch_item(new_path)
+                self.queue(new_path)
+
+    def on_item_changed(self, monitor, file, other_file, event_type, item_dir):
+        # Attribute-only changes (atime, permissions) can't change the index
+        if event_type == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+            return
+        self.queue(item_dir)
+
+    def queue(self, item_dir):
+        now = GLib.get_monotonic_time() // 1000
+        if not self.pending:
+            self.first_event = now
+        self.pending.add(item_dir)
+
+        if self.timeout_id is not None:
+            GLib.source_remove(self.timeout_id)
+        delay = min(self.DEBOUNCE_MS, max(0, self.first_event + self.MAX_DELAY_MS - now))
+        self.timeout_id = GLib.timeout_add(delay, self.flush)
+
+    def flush(self):
+        self.timeout_id = None
+        item_dirs, self.pending = self.pending, set()
+        if item_dirs:
+            self.on_changes(item_dirs)
+        return GLib.SOURCE_REMOVE
@@ -0,0 +1,34 @@
+from gi.repository import GLib
+from concurrent.futures import ThreadPoolExecutor
+
+class BackgroundWorker:
+    """
+    Runs tasks one at a time on a thread of its own and hands their results
+    back to the GTK main loop, for work that must not block drawing but has
+    to happen in order, like stopping and starting engines.
+    """
+
+    def __init__(self, name):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def submit(self, callback, fn, *args):
+        """Runs fn(*args) on the worker, then callback(result) on the main loop unless callback is None."""
+        return self.executor.submit(self._run, callback, fn, args)
+
+    def _run(self, callback, fn, args):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            print(f"Background task failed: {e}")
+            result = None
+        if callback is not None:
+            GLib.idle_add(self._deliver, callback, result)
+
+    @staticmethod
+    def _deliver(callback, result):
+        callback(result)
+        return GLib.SOURCE_REMOVE
+
+    def shutdown(self):
+        """Drops the tasks that did not start yet, the running one finishes."""
+        self.executor.shutdown(wait=False, cancel_futures=True)